@@ -0,0 +1,25 @@
+from django.contrib import admin
+
+from api.models import RecipeImageJob, RecipeImportJob, ShoppingCartExport
+
+
+@admin.register(ShoppingCartExport)
+class ShoppingCartExportAdmin(admin.ModelAdmin):
+    list_display = ('user', 'format', 'status', 'created_at', )
+    list_filter = ('status', 'format', )
+    readonly_fields = ('started_at', 'finished_at', )
+
+
+@admin.register(RecipeImageJob)
+class RecipeImageJobAdmin(admin.ModelAdmin):
+    list_display = ('recipe', 'status', 'created_at', )
+    list_filter = ('status', )
+    readonly_fields = ('started_at', 'finished_at', )
+    raw_id_fields = ('recipe', )
+
+
+@admin.register(RecipeImportJob)
+class RecipeImportJobAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'user', 'status', 'imported', 'created_at', )
+    list_filter = ('status', )
+    readonly_fields = ('started_at', 'finished_at', )
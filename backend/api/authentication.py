@@ -0,0 +1,120 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.permissions import SAFE_METHODS
+
+User = get_user_model()
+
+
+class TokenUserCache:
+    """Token -> user snapshots for authentication without a query.
+
+    Snapshots are kept in a per-process TTL LRU in front of the Django
+    cache, which must be shared between the processes. Invalidation
+    clears this process and the shared cache; other processes drop their
+    local copy when it expires, so AUTH_TOKEN_CACHE_TTL bounds how long a
+    logged out or deactivated user stays authenticated there.
+    """
+
+    def __init__(self):
+        self.local = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def cache_key(key):
+        # Token keys are credentials, keep them out of the shared cache.
+        return 'auth:token:' + hashlib.sha256(key.encode()).hexdigest()
+
+    @staticmethod
+    def make_snapshot(user):
+        fields = [field.attname for field in User._meta.concrete_fields]
+        return fields, [getattr(user, field) for field in fields]
+
+    def get(self, key):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.local.get(key)
+            if entry is not None and entry[0] > now:
+                self.local.move_to_end(key)
+                snapshot = entry[1]
+            else:
+                snapshot = None
+
+        if snapshot is None:
+            snapshot = cache.get(self.cache_key(key))
+            if snapshot is None:
+                return None
+            self.set_local(key, snapshot)
+        # A fresh instance per request: views may change request.user.
+        return User.from_db(None, *snapshot)
+
+    def set(self, key, user):
+        snapshot = self.make_snapshot(user)
+        self.set_local(key, snapshot)
+        cache.set(
+            self.cache_key(key), snapshot, settings.AUTH_TOKEN_CACHE_TIMEOUT
+        )
+
+    def set_local(self, key, snapshot):
+        expires_at = time.monotonic() + settings.AUTH_TOKEN_CACHE_TTL
+        with self.lock:
+            self.local[key] = (expires_at, snapshot)
+            self.local.move_to_end(key)
+            while len(self.local) > settings.AUTH_TOKEN_CACHE_SIZE:
+                self.local.popitem(last=False)
+
+    def clear_local(self):
+        with self.lock:
+            self.local.clear()
+
+    def invalidate(self, keys):
+        keys = set(keys)
+        with self.lock:
+            for key in keys:
+                self.local.pop(key, None)
+        cache.delete_many([self.cache_key(key) for key in keys])
+
+    def invalidate_user(self, user_id):
+        pk_index = User._meta.concrete_fields.index(User._meta.pk)
+        with self.lock:
+            keys = {
+                key for key, (_, (_, values)) in self.local.items()
+                if values[pk_index] == user_id
+            }
+        keys.update(
+            Token.objects.filter(user_id=user_id).values_list('key', flat=True)
+        )
+        self.invalidate(keys)
+
+
+token_user_cache = TokenUserCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication that looks tokens up in `token_user_cache`.
+
+    Only safe methods use the snapshots. Writes may save request.user
+    (profile edits, password changes), so they get the user from the
+    database and never write a stale snapshot back.
+    """
+    use_cache = True
+
+    def authenticate(self, request):
+        self.use_cache = request.method in SAFE_METHODS
+        return super().authenticate(request)
+
+    def authenticate_credentials(self, key):
+        user = token_user_cache.get(key) if self.use_cache else None
+        if user is not None:
+            return user, self.get_model()(key=key, user=user)
+
+        user, token = super().authenticate_credentials(key)
+        token_user_cache.set(key, user)
+        return user, token
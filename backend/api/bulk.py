@@ -0,0 +1,192 @@
+import json
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DatabaseError, transaction
+from django.db.models import F
+
+from api.image_jobs import enqueue_recipe_images
+from api.serializers import RecipeImportSerializer
+from recipes import feed
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from recipes.signals import catalog_changed
+
+User = get_user_model()
+
+
+def export_recipes(chunk_size=None):
+    """Yield every recipe as an NDJSON line accepted by RecipeImporter.
+
+    Recipes are read with a server-side cursor in chunks, so memory use
+    does not grow with the number of recipes.
+    """
+    recipes = Recipe.objects.order_by('pk').prefetch_related(
+        'tags', 'ingredients_set'
+    ).iterator(chunk_size=chunk_size or settings.RECIPE_EXPORT_CHUNK_SIZE)
+    for recipe in recipes:
+        row = {
+            'id': recipe.pk,
+            'author': recipe.author_id,
+            'name': recipe.name,
+            'text': recipe.text,
+            'cooking_time': recipe.cooking_time,
+            'image': recipe.image.name,
+            'pub_date': recipe.pub_date.isoformat(),
+            'tags': [tag.pk for tag in recipe.tags.all()],
+            'ingredients': [
+                {'id': item.ingredient_id, 'amount': item.amount}
+                for item in recipe.ingredients_set.all()
+            ],
+        }
+        yield json.dumps(row, ensure_ascii=False) + '\n'
+
+
+def iter_batches(lines, batch_size, start_line=1):
+    """Group non-empty lines into batches of (line number, line)."""
+    batch = []
+    for number, line in enumerate(lines, 1):
+        if number < start_line:
+            continue
+        if isinstance(line, bytes):
+            line = line.decode()
+        if not line.strip():
+            continue
+        batch.append((number, line))
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class RecipeImporter:
+    """Import NDJSON recipes in batches, one transaction per batch.
+
+    `run` yields a progress report per batch. An invalid batch stops the
+    import unless `skip_invalid` is set, a failed batch is rolled back.
+    Either way the import can be resumed from the first line of the
+    reported batch. `save_progress`, if given, is called with the report
+    of every written batch in the transaction of the batch, so that the
+    recorded progress never disagrees with the imported recipes.
+    """
+
+    def __init__(self, batch_size=None, skip_invalid=False):
+        self.batch_size = batch_size or settings.RECIPE_IMPORT_BATCH_SIZE
+        self.skip_invalid = skip_invalid
+
+    @staticmethod
+    def get_context(payloads):
+        """Load the existing ids referenced by a batch, one query each."""
+        ids = {'authors': [], 'tags': [], 'ingredients': []}
+        for payload in payloads:
+            if not isinstance(payload, dict):
+                continue
+            tags = payload.get('tags')
+            ingredients = payload.get('ingredients')
+            ids['authors'].append(payload.get('author'))
+            ids['tags'] += tags if isinstance(tags, list) else []
+            ids['ingredients'] += [
+                item.get('id') for item in (
+                    ingredients if isinstance(ingredients, list) else []
+                ) if isinstance(item, dict)
+            ]
+
+        return {
+            name: set(model.objects.filter(pk__in={
+                pk for pk in ids[name] if isinstance(pk, int)
+            }).values_list('pk', flat=True))
+            for name, model in (
+                ('authors', User), ('tags', Tag), ('ingredients', Ingredient)
+            )
+        }
+
+    def validate(self, batch):
+        payloads, errors = [], []
+        for number, line in batch:
+            try:
+                payloads.append((number, json.loads(line)))
+            except ValueError as error:
+                errors.append({'line': number, 'errors': str(error)})
+
+        context = self.get_context(payload for _, payload in payloads)
+        rows = []
+        for number, payload in payloads:
+            serializer = RecipeImportSerializer(data=payload, context=context)
+            if serializer.is_valid():
+                rows.append(serializer.validated_data)
+            else:
+                errors.append({'line': number, 'errors': serializer.errors})
+        return rows, errors
+
+    @staticmethod
+    def write(rows):
+        recipes = Recipe.objects.bulk_create([
+            Recipe(
+                author_id=row['author'], name=row['name'],
+                image=row['image'], text=row['text'],
+                cooking_time=row['cooking_time'],
+            )
+            for row in rows
+        ])
+
+        dated = []
+        for recipe, row in zip(recipes, rows):
+            if 'pub_date' in row:
+                recipe.pub_date = row['pub_date']
+                dated.append(recipe)
+        if dated:
+            Recipe.objects.bulk_update(dated, ['pub_date'])
+
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(
+                recipe=recipe, ingredient_id=item['id'],
+                amount=item['amount']
+            )
+            for recipe, row in zip(recipes, rows)
+            for item in row['ingredients']
+        ])
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe=recipe, tag_id=tag)
+            for recipe, row in zip(recipes, rows)
+            for tag in row['tags']
+        ])
+
+        # bulk_create sends no signals, count the new recipes and queue
+        # their images here.
+        for author, count in Counter(row['author'] for row in rows).items():
+            User.objects.filter(pk=author).update(
+                recipes_count=F('recipes_count') + count
+            )
+        enqueue_recipe_images(recipe.pk for recipe in recipes)
+        feed.fan_out(recipe.pk for recipe in recipes)
+        catalog_changed.send(sender=Recipe)
+        return len(recipes)
+
+    def run(self, lines, start_line=1, save_progress=None):
+        for batch in iter_batches(lines, self.batch_size, start_line):
+            report = {
+                'first_line': batch[0][0],
+                'last_line': batch[-1][0],
+                'imported': 0,
+            }
+            rows, errors = self.validate(batch)
+            if errors:
+                report['errors'] = errors
+                if not self.skip_invalid:
+                    yield {**report, 'status': 'invalid'}
+                    return
+
+            try:
+                with transaction.atomic():
+                    report['imported'] = self.write(rows) if rows else 0
+                    report['status'] = 'imported'
+                    if save_progress is not None:
+                        save_progress(report)
+            except DatabaseError as error:
+                yield {
+                    **report, 'imported': 0, 'status': 'failed',
+                    'error': str(error)
+                }
+                return
+            yield report
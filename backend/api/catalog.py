@@ -0,0 +1,88 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+NOT_FOUND = object()
+
+
+class CatalogCache:
+    """Versioned cache of serialized reference data (tags, ingredients).
+
+    Payloads are kept in a per-process LRU in front of the Django cache.
+    Both are keyed by the catalog version, which is a timestamp stored
+    in the Django cache: bumping it invalidates every process at once and
+    doubles as the Last-Modified value of the responses. With several
+    worker processes the Django cache must be shared (not LocMemCache).
+    Each process rechecks the version every `version_ttl` seconds
+    (CATALOG_CACHE_VERSION_TTL by default).
+    """
+
+    def __init__(self, name, version_ttl=None):
+        self.name = name
+        self.version_ttl = version_ttl
+        self.local = OrderedDict()
+        self.lock = threading.Lock()
+        self._version = None
+        self._version_checked_at = 0
+
+    @property
+    def version_key(self):
+        return f'catalog:{self.name}:version'
+
+    def version(self):
+        now = time.time()
+        ttl = self.version_ttl
+        if ttl is None:
+            ttl = settings.CATALOG_CACHE_VERSION_TTL
+        if self._version is None or now - self._version_checked_at > ttl:
+            cache.add(self.version_key, now, timeout=None)
+            self._version = cache.get(self.version_key, now)
+            self._version_checked_at = now
+        return self._version
+
+    def invalidate(self):
+        version = max(time.time(), (self._version or 0) + 1e-6)
+        cache.set(self.version_key, version, timeout=None)
+        self._version = version
+        self._version_checked_at = time.time()
+        with self.lock:
+            self.local.clear()
+
+    def clear_local(self):
+        """Forget the version and payloads held by this process."""
+        with self.lock:
+            self.local.clear()
+        self._version = None
+        self._version_checked_at = 0
+
+    def get_or_set(self, key, default):
+        """Return the payload cached under `key`, computing it if needed."""
+        key = f'catalog:{self.name}:{self.version()}:{key}'
+
+        with self.lock:
+            value = self.local.get(key, NOT_FOUND)
+            if value is not NOT_FOUND:
+                self.local.move_to_end(key)
+                return value
+
+        value = cache.get(key, NOT_FOUND)
+        if value is NOT_FOUND:
+            value = default()
+            cache.set(key, value, settings.CATALOG_CACHE_TIMEOUT)
+
+        with self.lock:
+            self.local[key] = value
+            while len(self.local) > settings.CATALOG_CACHE_LOCAL_SIZE:
+                self.local.popitem(last=False)
+        return value
+
+
+tags_catalog = CatalogCache('tags')
+ingredients_catalog = CatalogCache('ingredients')
+# Only its version is used: bumped on every recipe change, it validates
+# the recipe lists. Rechecked on each request, so that a list never
+# outlives a write made through another process.
+recipes_catalog = CatalogCache('recipes', version_ttl=0)
@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.dummy.DummyCache',
+    'django.core.cache.backends.locmem.LocMemCache',
+)
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """The catalog and recipe versions, token snapshots and replica
+    stickiness are only seen by every process through a shared cache."""
+    if settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Warning(
+        'The default cache is local to the process: changes made by other '
+        'processes (workers, management commands) are not seen.',
+        hint='Set CACHE_BACKEND and CACHE_LOCATION to a shared cache such '
+             'as Redis.',
+        id='api.W001',
+    )]
@@ -0,0 +1,50 @@
+import logging
+import tempfile
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.files import File
+
+from api import jobs
+from api.exports import export_shopping_cart, get_exporters
+from api.jobs import claim_next_job
+from api.models import ShoppingCartExport
+
+logger = logging.getLogger(__name__)
+
+
+def claim_next_export():
+    return claim_next_job(
+        ShoppingCartExport, settings.SHOPPING_CART_EXPORT_TIMEOUT
+    )
+
+
+def process_export(export):
+    exporter = get_exporters().get(export.format)
+    try:
+        if exporter is None:
+            raise ValueError(f'Unknown export format "{export.format}".')
+
+        with tempfile.TemporaryFile() as output:
+            for chunk in export_shopping_cart(export.user, exporter):
+                output.write(chunk)
+            output.seek(0)
+            export.file.save(
+                f'{uuid4().hex}.{exporter.extension}', File(output),
+                save=False
+            )
+        export.status = ShoppingCartExport.DONE
+    except Exception as err:
+        logger.error(err, exc_info=True)
+        export.status = ShoppingCartExport.FAILED
+        export.error = str(err)
+
+    if jobs.finish_job(export, 'file'):
+        logger.info(
+            f'Export {export.pk} finished with status {export.status}'
+        )
+
+
+def run_worker(poll_interval, burst=False):
+    """Process queued exports until stopped (or the queue is empty)."""
+    jobs.run_worker(claim_next_export, process_export, poll_interval, burst)
@@ -0,0 +1,133 @@
+import csv
+import hashlib
+import io
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Sum
+from django.utils.module_loading import import_string
+
+from api.pdf import PDFWriter
+from recipes.models import Recipe, ShoppingListItem
+
+CACHE_KEY_PREFIX = 'shopping_cart'
+
+
+def get_shopping_cart(user):
+    """Evaluate everything an export needs into plain data."""
+    recipes = Recipe.objects.filter(
+        shopping_cart__user=user
+    ).values_list('name', flat=True)
+    ingredients = ShoppingListItem.objects.filter(user=user).values_list(
+        'ingredient__name', 'ingredient__measurement_unit'
+    ).annotate(
+        total=Sum('total_amount')
+    ).order_by('ingredient__name', 'ingredient__measurement_unit')
+
+    return {
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'recipes': list(recipes),
+        'ingredients': [list(ingredient) for ingredient in ingredients],
+    }
+
+
+def get_cart_digest(cart):
+    payload = json.dumps(cart, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class BaseCartExporter:
+    format = None
+    content_type = None
+    extension = None
+
+    def render(self, cart):
+        """Yield the rendered shopping cart as chunks of bytes."""
+        raise NotImplementedError
+
+    @staticmethod
+    def get_lines(cart):
+        yield f'Привет, {cart["first_name"]} {cart["last_name"]}!'
+        yield ''
+        yield 'Список блюд к приготовлению'
+        for name in cart['recipes']:
+            yield f'  • {name}'
+        yield ''
+        yield 'Для этого тебе понадобятся следующие ингредиенты'
+        for name, measurement_unit, total_amount in cart['ingredients']:
+            yield f'  • {name} - {total_amount}, {measurement_unit}'
+        yield ''
+        yield 'Твой продуктовый помощник Foodgram :)'
+
+
+class TextCartExporter(BaseCartExporter):
+    format = 'txt'
+    content_type = 'text/plain; charset=utf-8'
+    extension = 'txt'
+
+    def render(self, cart):
+        for line in self.get_lines(cart):
+            yield f'{line}\n'.encode()
+
+
+class CSVCartExporter(BaseCartExporter):
+    format = 'csv'
+    content_type = 'text/csv; charset=utf-8'
+    extension = 'csv'
+
+    def render(self, cart):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(('name', 'measurement_unit', 'total_amount'))
+        for row in cart['ingredients']:
+            writer.writerow(row)
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue().encode()
+
+
+class PDFCartExporter(BaseCartExporter):
+    format = 'pdf'
+    content_type = 'application/pdf'
+    extension = 'pdf'
+
+    def render(self, cart):
+        lines = [
+            (line, 16 if index == 0 else 12)
+            for index, line in enumerate(self.get_lines(cart))
+        ]
+        yield from PDFWriter(settings.SHOPPING_CART_PDF_FONT).render(lines)
+
+
+def get_exporters():
+    exporters = (
+        import_string(path)() for path in settings.SHOPPING_CART_EXPORTERS
+    )
+    return {exporter.format: exporter for exporter in exporters}
+
+
+def _cache_chunks(key, chunks):
+    rendered = []
+    for chunk in chunks:
+        rendered.append(chunk)
+        yield chunk
+    cache.set(
+        key, b''.join(rendered), settings.SHOPPING_CART_CACHE_TIMEOUT
+    )
+
+
+def export_shopping_cart(user, exporter):
+    """Return an iterator over the exported shopping cart of `user`.
+
+    Output is cached under a digest of the cart contents, so an unchanged
+    cart is served without rendering it again.
+    """
+    cart = get_shopping_cart(user)
+    key = f'{CACHE_KEY_PREFIX}:{exporter.format}:{get_cart_digest(cart)}'
+    rendered = cache.get(key)
+    if rendered is not None:
+        return iter((rendered, ))
+    return _cache_chunks(key, exporter.render(cart))
@@ -1,14 +1,6 @@
 from django_filters import rest_framework as filters
 
-from recipes.models import Ingredient, Recipe, Tag
-
-
-class IngredientFilter(filters.FilterSet):
-    name = filters.CharFilter(lookup_expr='istartswith')
-
-    class Meta:
-        model = Ingredient
-        fields = ['name', ]
+from recipes.models import Recipe, Tag
 
 
 class RecipeFilter(filters.FilterSet):
@@ -17,11 +9,15 @@ class RecipeFilter(filters.FilterSet):
         to_field_name='slug',
         queryset=Tag.objects.all()
     )
+    search = filters.CharFilter(method='filter_search')
 
     class Meta:
         model = Recipe
         fields = ['author', 'tags']
 
+    def filter_search(self, queryset, name, value):
+        return queryset.search(value)
+
     @property
     def qs(self):
         queryset = super().qs
@@ -30,9 +26,9 @@ class RecipeFilter(filters.FilterSet):
         for key, value in self.request.query_params.items():
             if (key == 'is_favorited' and value == '1'
                     and user.is_authenticated):
-                queryset = queryset.filter(favorites__user=user)
+                queryset = queryset.filter(is_favorited=True)
             if (key == 'is_in_shopping_cart' and value == '1'
                     and user.is_authenticated):
-                queryset = queryset.filter(shopping_cart__user=user)
+                queryset = queryset.filter(is_in_shopping_cart=True)
 
         return queryset
@@ -0,0 +1,131 @@
+import logging
+from io import BytesIO
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from api import jobs
+from api.models import RecipeImageJob
+from foodgram.storage import release_files
+from recipes.models import Recipe
+from recipes.signals import catalog_changed
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp'}
+
+
+def enqueue_recipe_images(recipe_ids):
+    """Queue image jobs for recipes without one already pending."""
+    recipe_ids = set(recipe_ids)
+    pending = set(RecipeImageJob.objects.filter(
+        recipe_id__in=recipe_ids, status=RecipeImageJob.PENDING
+    ).values_list('recipe_id', flat=True))
+    return RecipeImageJob.objects.bulk_create([
+        RecipeImageJob(recipe_id=pk) for pk in recipe_ids - pending
+    ])
+
+
+def claim_next_image_job():
+    return jobs.claim_next_job(
+        RecipeImageJob, settings.RECIPE_IMAGE_JOB_TIMEOUT
+    )
+
+
+def open_image(file):
+    """Open an image, checking its size before decoding the pixels."""
+    image = Image.open(file)
+    width, height = image.size
+    if width * height > settings.RECIPE_IMAGE_MAX_PIXELS:
+        raise ValueError(f'Image is too large: {width}x{height}.')
+    image.load()
+    return image
+
+
+def encode(image, image_format, **options):
+    """Encode an image without the source metadata (EXIF, text chunks)."""
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    elif image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    output = BytesIO()
+    image.save(output, image_format, **options)
+    name = f'{uuid4().hex}.{EXTENSIONS[image_format]}'
+    return ContentFile(output.getvalue(), name=name)
+
+
+def render_images(file):
+    """Return {field: file} with the stripped original and renditions."""
+    with file.open('rb'):
+        image = open_image(file)
+    original_format = image.format if image.format in EXTENSIONS else 'PNG'
+    image = ImageOps.exif_transpose(image)
+
+    files = {'image': encode(
+        image, original_format, **settings.RECIPE_IMAGE_ORIGINAL_OPTIONS
+    )}
+    rendition_format = settings.RECIPE_IMAGE_FORMAT
+    for field, size in settings.RECIPE_IMAGE_RENDITIONS.items():
+        rendition = image.copy()
+        rendition.thumbnail((size, size), Image.Resampling.LANCZOS)
+        files[field] = encode(
+            rendition, rendition_format, quality=settings.RECIPE_IMAGE_QUALITY
+        )
+    return files
+
+
+def save_images(recipe, source, files):
+    """Store the rendered files if the recipe image is still `source`.
+
+    Returns False when the image was changed while rendering and the
+    files were not used. Unused and replaced files are released.
+    """
+    names = {}
+    for field, content in files.items():
+        model_field = Recipe._meta.get_field(field)
+        names[field] = model_field.storage.save(
+            model_field.generate_filename(recipe, content.name), content
+        )
+
+    with transaction.atomic():
+        current = Recipe.objects.select_for_update().filter(
+            pk=recipe.pk, image=source
+        ).first()
+        if current is not None:
+            Recipe.objects.filter(pk=recipe.pk).update(
+                updated_at=timezone.now(), **names
+            )
+            catalog_changed.send(sender=Recipe)
+            release_files(getattr(current, field).name for field in names)
+        else:
+            release_files(names.values())
+    return current is not None
+
+
+def process_image_job(job):
+    recipe = job.recipe
+    source = recipe.image.name
+    try:
+        if not save_images(recipe, source, render_images(recipe.image)):
+            logger.info(f'Image of recipe {recipe.pk} changed, skipped')
+        job.status = RecipeImageJob.DONE
+    except Exception as err:
+        logger.error(err, exc_info=True)
+        job.status = RecipeImageJob.FAILED
+        job.error = str(err)
+
+    if jobs.finish_job(job):
+        logger.info(
+            f'Image job {job.pk} finished with status {job.status}'
+        )
+
+
+def run_worker(poll_interval, burst=False):
+    """Process queued image jobs until stopped (or the queue is empty)."""
+    jobs.run_worker(
+        claim_next_image_job, process_image_job, poll_interval, burst
+    )
@@ -0,0 +1,75 @@
+import logging
+
+from django.conf import settings
+from django.utils import timezone
+
+from api import jobs
+from api.bulk import RecipeImporter
+from api.jobs import claim_next_job
+from api.models import RecipeImportJob
+from foodgram.storage import release_files
+
+logger = logging.getLogger(__name__)
+
+
+def claim_next_import():
+    return claim_next_job(RecipeImportJob, settings.RECIPE_IMPORT_TIMEOUT)
+
+
+def process_import(job):
+    """Import the file of a job, saving the report with every batch.
+
+    Every batch is committed together with its report, so a job picked up
+    again after a crashed worker continues right after the last imported
+    batch.
+    """
+    start_line = job.start_line
+    if job.batches:
+        start_line = job.batches[-1]['last_line'] + 1
+
+    def save_progress(batch):
+        # A fresh start date keeps a long import from being claimed
+        # again as stale, RECIPE_IMPORT_TIMEOUT bounds a single batch.
+        progress = {
+            'imported': job.imported + batch['imported'],
+            'batches': job.batches + [batch],
+            'started_at': timezone.now(),
+        }
+        if not RecipeImportJob.objects.filter(
+            pk=job.pk, attempts=job.attempts
+        ).update(**progress):
+            # Rolls the batch back, the new attempt imports it.
+            raise jobs.JobClaimedAgainError(f'{job} was claimed again')
+        # Only kept once saved: a rolled back batch leaves no trace.
+        for field, value in progress.items():
+            setattr(job, field, value)
+
+    importer = RecipeImporter(skip_invalid=job.skip_invalid)
+    job.status = RecipeImportJob.DONE
+    try:
+        with job.file.open('rb') as lines:
+            for batch in importer.run(lines, start_line, save_progress):
+                if batch['status'] != 'imported':
+                    save_progress(batch)
+                    job.status = RecipeImportJob.FAILED
+                    job.error = (
+                        f'Lines {batch["first_line"]}-{batch["last_line"]} '
+                        f'were not imported ({batch.get("error", "invalid")})'
+                        f'. Fix them and resume with '
+                        f'start_line={batch["first_line"]}.'
+                    )
+    except Exception as err:
+        logger.error(err, exc_info=True)
+        job.status = RecipeImportJob.FAILED
+        job.error = str(err)
+
+    upload = job.file.name
+    job.file = ''
+    if jobs.finish_job(job, 'file'):
+        release_files([upload])
+        logger.info(f'Import {job.pk} finished with status {job.status}')
+
+
+def run_worker(poll_interval, burst=False):
+    """Process queued imports until stopped (or the queue is empty)."""
+    jobs.run_worker(claim_next_import, process_import, poll_interval, burst)
@@ -0,0 +1,120 @@
+import threading
+from bisect import bisect_left
+
+from django.conf import settings
+
+from api.catalog import ingredients_catalog
+from recipes.models import Ingredient
+
+
+class IngredientIndex:
+    """In-memory, case-folded name index for ingredient autocomplete.
+
+    Entries are kept sorted by folded name, so prefix matches are a
+    bisect plus a short scan. The index is tied to the ingredients
+    catalog version: it is rebuilt when another process changed the
+    catalog (e.g. `add_ingredients`) and patched for changes made by this
+    process. Keys and items are replaced together as one immutable
+    snapshot, so searches read them without the lock.
+    """
+
+    def __init__(self):
+        self.entries = ((), ())
+        self.names = {}
+        self.version = None
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def get_key(name, pk):
+        return name.casefold(), pk
+
+    def build(self):
+        rows = Ingredient.objects.order_by().values(
+            'id', 'name', 'measurement_unit'
+        )
+        entries = sorted(
+            (self.get_key(row['name'], row['id']), row) for row in rows
+        )
+        keys = tuple(key for key, _ in entries)
+        self.names = {key[1]: key for key in keys}
+        self.entries = keys, tuple(item for _, item in entries)
+
+    def ensure_fresh(self):
+        version = ingredients_catalog.version()
+        if self.version != version:
+            with self.lock:
+                if self.version != version:
+                    self.build()
+                    self.version = version
+
+    def _remove(self, keys, items, pk):
+        key = self.names.pop(pk, None)
+        if key is not None:
+            position = bisect_left(keys, key)
+            del keys[position]
+            del items[position]
+
+    def apply(self, old_version, new_version, saved=None, deleted=None):
+        """Patch the index after a change moved the catalog version on.
+
+        If the index did not match `old_version` it is left stale and is
+        rebuilt on the next search.
+        """
+        with self.lock:
+            if self.version is None or self.version != old_version:
+                return
+            keys, items = map(list, self.entries)
+            if deleted is not None:
+                self._remove(keys, items, deleted)
+            if saved is not None:
+                self._remove(keys, items, saved.pk)
+                key = self.get_key(saved.name, saved.pk)
+                position = bisect_left(keys, key)
+                keys.insert(position, key)
+                items.insert(position, {
+                    'id': saved.pk,
+                    'name': saved.name,
+                    'measurement_unit': saved.measurement_unit,
+                })
+                self.names[saved.pk] = key
+            self.entries = tuple(keys), tuple(items)
+            self.version = new_version
+
+    def search(self, query, limit=None):
+        """Return prefix matches first, then substring matches.
+
+        Substring matches need a scan of the whole index, they stop at
+        `limit` or at INGREDIENT_SEARCH_LIMIT results.
+        """
+        self.ensure_fresh()
+        query = query.casefold()
+        keys, items = self.entries
+        found = []
+
+        position = bisect_left(keys, (query, ))
+        while (position < len(keys) and keys[position][0].startswith(query)
+               and (limit is None or len(found) < limit)):
+            found.append(items[position])
+            position += 1
+
+        if limit is None:
+            limit = max(len(found), settings.INGREDIENT_SEARCH_LIMIT)
+        if query and len(found) < limit:
+            for key, item in zip(keys, items):
+                if query in key[0] and not key[0].startswith(query):
+                    found.append(item)
+                    if len(found) >= limit:
+                        break
+        return found
+
+
+ingredient_index = IngredientIndex()
+
+
+def refresh_ingredients(saved=None, deleted=None):
+    old_version = ingredients_catalog.version()
+    ingredients_catalog.invalidate()
+    ingredient_index.apply(
+        old_version, ingredients_catalog.version(),
+        saved=saved, deleted=deleted
+    )
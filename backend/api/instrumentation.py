@@ -0,0 +1,244 @@
+import logging
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from contextvars import ContextVar
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_current_stats = ContextVar('request_stats', default=None)
+
+
+class RequestStats:
+    __slots__ = (
+        'started', 'queries', 'db_time', 'fingerprints', 'serializer_time',
+        'serializing', 'render_started', 'render_time',
+    )
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.fingerprints = Counter()
+        self.serializer_time = 0.0
+        self.serializing = False
+        self.render_started = None
+        self.render_time = 0.0
+
+    @property
+    def duplicates(self):
+        """Queries repeating an earlier one of the same request (N+1)."""
+        return sum(count - 1 for count in self.fingerprints.values())
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+            # Parameters are passed separately, so the SQL text is already
+            # a fingerprint shared by the repeats of a query.
+            self.fingerprints[sql] += 1
+
+    def server_timing(self, total):
+        return ', '.join((
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries, '
+            f'{self.duplicates} duplicates"',
+            f'serialize;dur={self.serializer_time * 1000:.1f}',
+            f'render;dur={self.render_time * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ))
+
+
+def record_query(execute, sql, params, many, context):
+    """Execute wrapper installed on every database connection.
+
+    The stats are looked up in the context of the request, so queries
+    are recorded whichever connection they run on, including the replica
+    and connections opened during the request.
+    """
+    stats = _current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats.record_query(execute, sql, params, many, context)
+
+
+def instrument_connection(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class TimedSerializerMixin:
+    """Add the time spent in `to_representation` to the request stats.
+
+    Only the outermost serializer is timed, nested ones are part of it.
+    The time includes the queries a serializer triggers by itself.
+    """
+
+    def to_representation(self, instance):
+        stats = _current_stats.get()
+        if stats is None or stats.serializing:
+            return super().to_representation(instance)
+
+        stats.serializing = True
+        started = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            stats.serializer_time += time.perf_counter() - started
+            stats.serializing = False
+
+
+class RequestMetrics:
+    """Per-process aggregate of request stats.
+
+    Totals are kept per route for the lifetime of the process, recent
+    durations in a ring buffer for the latency quantiles.
+    """
+
+    quantiles = (0.5, 0.95, 0.99)
+
+    def __init__(self, size):
+        self.recent = deque(maxlen=size)
+        self.requests = Counter()
+        self.totals = defaultdict(lambda: [0.0] * 6)
+        self.lock = threading.Lock()
+
+    def add(self, method, route, status, duration, stats):
+        with self.lock:
+            self.recent.append((route, duration))
+            self.requests[method, route, status] += 1
+            totals = self.totals[route]
+            totals[0] += duration
+            totals[1] += stats.db_time
+            totals[2] += stats.queries
+            totals[3] += stats.duplicates
+            totals[4] += stats.serializer_time
+            totals[5] += stats.render_time
+
+    def export(self):
+        """Return the metrics in the Prometheus text format."""
+        with self.lock:
+            recent = list(self.recent)
+            requests = dict(self.requests)
+            totals = {route: list(values) for route, values in
+                      self.totals.items()}
+
+        durations = defaultdict(list)
+        for route, duration in recent:
+            durations[route].append(duration)
+
+        lines = [
+            '# HELP foodgram_requests_total Handled requests.',
+            '# TYPE foodgram_requests_total counter',
+        ]
+        for (method, route, status), count in sorted(requests.items()):
+            lines.append(
+                f'foodgram_requests_total{{method="{method}",'
+                f'route="{route}",status="{status}"}} {count}'
+            )
+
+        lines += [
+            '# HELP foodgram_request_duration_seconds Request latency, '
+            'quantiles over the recent requests.',
+            '# TYPE foodgram_request_duration_seconds summary',
+        ]
+        for route, values in sorted(durations.items()):
+            values.sort()
+            for quantile in self.quantiles:
+                value = values[min(int(quantile * len(values)),
+                                   len(values) - 1)]
+                lines.append(
+                    f'foodgram_request_duration_seconds{{route="{route}",'
+                    f'quantile="{quantile}"}} {value:.6f}'
+                )
+        for route, values in sorted(totals.items()):
+            count = sum(
+                total for (_, name, _), total in requests.items()
+                if name == route
+            )
+            lines.append(
+                f'foodgram_request_duration_seconds_sum{{route="{route}"}} '
+                f'{values[0]:.6f}'
+            )
+            lines.append(
+                f'foodgram_request_duration_seconds_count{{route="{route}"}} '
+                f'{count}'
+            )
+
+        for index, name, kind, description in (
+            (1, 'db_seconds', 'counter', 'Time spent in database queries.'),
+            (2, 'queries', 'counter', 'Executed database queries.'),
+            (3, 'duplicate_queries', 'counter',
+             'Queries repeating an earlier one of the same request.'),
+            (4, 'serializer_seconds', 'counter', 'Time spent serializing.'),
+            (5, 'render_seconds', 'counter', 'Time spent rendering.'),
+        ):
+            lines.append(f'# HELP foodgram_request_{name}_total {description}')
+            lines.append(f'# TYPE foodgram_request_{name}_total {kind}')
+            for route, values in sorted(totals.items()):
+                lines.append(
+                    f'foodgram_request_{name}_total{{route="{route}"}} '
+                    f'{values[index]:g}'
+                )
+        return '\n'.join(lines) + '\n'
+
+
+request_metrics = RequestMetrics(settings.INSTRUMENTATION_BUFFER_SIZE)
+
+
+class InstrumentationMiddleware:
+    """Record queries and timings of every request.
+
+    They are returned in the Server-Timing header, added to the process
+    metrics, and requests slower than INSTRUMENTATION_SLOW_REQUEST are
+    logged with their most repeated query.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = RequestStats()
+        token = _current_stats.set(stats)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_stats.reset(token)
+
+        duration = time.perf_counter() - stats.started
+        match = request.resolver_match
+        route = match.view_name if match else 'unmatched'
+        response['Server-Timing'] = stats.server_timing(duration)
+        request_metrics.add(
+            request.method, route, response.status_code, duration, stats
+        )
+
+        if duration > settings.INSTRUMENTATION_SLOW_REQUEST:
+            sql, count = (stats.fingerprints.most_common(1) or [('', 0)])[0]
+            logger.warning(
+                'Slow request %s %s: %.0f ms, %d queries (%.0f ms), '
+                '%d duplicates, serialize %.0f ms, render %.0f ms. '
+                'Most repeated query (%d times): %s',
+                request.method, request.get_full_path(), duration * 1000,
+                stats.queries, stats.db_time * 1000, stats.duplicates,
+                stats.serializer_time * 1000, stats.render_time * 1000,
+                count, sql[:500]
+            )
+        return response
+
+    def process_template_response(self, request, response):
+        stats = _current_stats.get()
+        if stats is not None:
+            stats.render_started = time.perf_counter()
+            response.add_post_render_callback(self.rendered)
+        return response
+
+    @staticmethod
+    def rendered(response):
+        stats = _current_stats.get()
+        if stats is not None and stats.render_started is not None:
+            stats.render_time += time.perf_counter() - stats.render_started
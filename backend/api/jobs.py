@@ -0,0 +1,115 @@
+import logging
+import multiprocessing
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import (DatabaseError, close_old_connections, connections,
+                       transaction)
+from django.db.models import F
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class JobClaimedAgainError(Exception):
+    """The job ran past its timeout and another worker claimed it."""
+
+
+def claim_next_job(model, timeout):
+    """Mark the oldest queued job of `model` as running and return it.
+
+    Jobs left running by a crashed worker for longer than `timeout`
+    seconds are picked up again, up to BACKGROUND_JOB_MAX_ATTEMPTS
+    attempts in all; then they are marked failed. Stale and queued jobs
+    are looked up separately, each with its own partial index.
+    """
+    stale_before = timezone.now() - timedelta(seconds=timeout)
+    queues = (
+        model.objects.filter(
+            status=model.RUNNING, started_at__lt=stale_before
+        ).order_by('started_at'),
+        model.objects.filter(
+            status=model.PENDING
+        ).order_by('created_at', 'pk'),
+    )
+
+    for queue in queues:
+        while True:
+            with transaction.atomic():
+                job = queue.select_for_update(skip_locked=True).first()
+                if job is None:
+                    break
+
+                if job.attempts >= settings.BACKGROUND_JOB_MAX_ATTEMPTS:
+                    job.status = model.FAILED
+                    job.error = (
+                        f'Gave up after {job.attempts} attempts, the last '
+                        f'one did not finish in {timeout} s.'
+                    )
+                    job.finished_at = timezone.now()
+                    job.save(update_fields=['status', 'error', 'finished_at'])
+                    logger.error(f'{job} failed: {job.error}')
+                    continue
+
+                job.status = model.RUNNING
+                job.started_at = timezone.now()
+                job.attempts = F('attempts') + 1
+                job.save(update_fields=['status', 'started_at', 'attempts'])
+            job.refresh_from_db()
+            return job
+    return None
+
+
+def finish_job(job, *fields):
+    """Save the outcome of a job with `fields`, return False when the job
+    was claimed again meanwhile: its outcome then belongs to the new
+    attempt and is not saved."""
+    job.finished_at = timezone.now()
+    fields = ('status', 'error', 'finished_at') + fields
+    finished = type(job).objects.filter(
+        pk=job.pk, status=job.RUNNING, attempts=job.attempts
+    ).update(**{field: getattr(job, field) for field in fields})
+    if not finished:
+        logger.warning(f'{job} was claimed again, outcome dropped')
+    return bool(finished)
+
+
+def run_worker(claim, process, poll_interval, burst=False):
+    """Process claimed jobs until stopped (or the queue is empty)."""
+    while True:
+        try:
+            job = claim()
+        except DatabaseError as err:
+            logger.error(err, exc_info=True)
+            close_old_connections()
+            time.sleep(poll_interval)
+            continue
+        if job is None:
+            if burst:
+                return
+            time.sleep(poll_interval)
+            continue
+        process(job)
+
+
+def run_pool(target, args, workers):
+    """Run `target(*args)` in `workers` forked processes."""
+    if workers <= 1:
+        target(*args)
+        return
+
+    # Every forked process must open its own database connection.
+    connections.close_all()
+    context = multiprocessing.get_context('fork')
+    processes = [
+        context.Process(target=target, args=args) for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
@@ -0,0 +1,131 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from recipes.models import Recipe, Tag
+
+User = get_user_model()
+
+
+def iter_plan_nodes(node):
+    yield node
+    for child in node.get('Plans', ()):
+        yield from iter_plan_nodes(child)
+
+
+def get_seq_scans(plan, max_rows):
+    """Yield (table, rows read) for sequential scans over `max_rows`."""
+    for node in iter_plan_nodes(plan):
+        if node['Node Type'] != 'Seq Scan':
+            continue
+        scanned = node['Actual Loops'] * (
+            node['Actual Rows'] + node.get('Rows Removed by Filter', 0)
+        )
+        if scanned > max_rows:
+            yield node['Relation Name'], scanned
+
+
+class Command(BaseCommand):
+    help = (
+        'Running EXPLAIN (ANALYZE, BUFFERS) on the queries of the main API '
+        'endpoints and failing on large sequential scans.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int,
+            help='Id of the user to request as (default: most favorites).'
+        )
+        parser.add_argument(
+            '--max-seq-rows', type=int, default=10000,
+            help='Largest number of rows a sequential scan may read.'
+        )
+
+    def get_endpoints(self, user):
+        recipe = Recipe.objects.order_by('-pub_date').first()
+        tag = Tag.objects.first()
+        author = (
+            User.objects.filter(followers__user=user).first()
+            or (recipe and recipe.author)
+        )
+
+        endpoints = [
+            '/api/recipes/',
+            '/api/recipes/?is_favorited=1',
+            '/api/recipes/?is_in_shopping_cart=1',
+            '/api/recipes/?pagination=cursor',
+            '/api/recipes/?search=salad',
+            '/api/users/subscriptions/?recipes_limit=3',
+            '/api/recipes/download_shopping_cart/?format=csv',
+        ]
+        if recipe is not None:
+            endpoints.append(f'/api/recipes/{recipe.pk}/')
+        if tag is not None:
+            endpoints.append(f'/api/recipes/?tags={tag.slug}')
+        if author is not None:
+            endpoints.append(f'/api/recipes/?author={author.pk}')
+        return endpoints
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}')
+            return cursor.fetchone()[0][0]
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Query plans can only be audited on Postgres.')
+
+        if options['user']:
+            user = User.objects.get(pk=options['user'])
+        else:
+            user = User.objects.annotate(
+                favorites_total=Count('favorites')
+            ).order_by('-favorites_total', 'pk').first()
+        if user is None:
+            raise CommandError('The database has no users, seed it first.')
+
+        client = APIClient()
+        client.force_authenticate(user)
+        violations = []
+
+        for url in self.get_endpoints(user):
+            with CaptureQueriesContext(connection) as context:
+                response = client.get(url)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+
+            total_time = shared_hit = shared_read = 0
+            selects = [
+                query['sql'] for query in context.captured_queries
+                if query['sql'].lstrip().upper().startswith('SELECT')
+            ]
+            for sql in selects:
+                explained = self.explain(sql)
+                plan = explained['Plan']
+                total_time += explained['Execution Time']
+                shared_hit += plan.get('Shared Hit Blocks', 0)
+                shared_read += plan.get('Shared Read Blocks', 0)
+
+                for table, scanned in get_seq_scans(
+                    plan, options['max_seq_rows']
+                ):
+                    violations.append(
+                        f'{url}: seq scan on {table} read {scanned} rows'
+                        f'\n    {sql[:200]}'
+                    )
+
+            self.stdout.write(
+                f'{response.status_code} {url}: {len(selects)} queries, '
+                f'{total_time:.2f} ms, shared hit {shared_hit}, '
+                f'read {shared_read}'
+            )
+
+        if violations:
+            raise CommandError(
+                'Sequential scans above the threshold:\n'
+                + '\n'.join(violations)
+            )
+        self.stdout.write(self.style.SUCCESS('No large sequential scans.'))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from api.image_jobs import enqueue_recipe_images
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Queueing image jobs for recipes without renditions.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Render the images of every recipe again.'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.filter(image_small='')
+        ids = list(recipes.values_list('pk', flat=True))
+
+        created = 0
+        for start in range(0, len(ids), options['batch_size']):
+            created += len(enqueue_recipe_images(
+                ids[start:start + options['batch_size']]
+            ))
+        self.stdout.write(f'Image jobs: {created} queued.')
@@ -0,0 +1,25 @@
+import sys
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand
+
+from api.bulk import export_recipes
+
+
+class Command(BaseCommand):
+    help = 'Exporting all recipes as NDJSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output', default='-', help='NDJSON file, "-" for stdout.'
+        )
+        parser.add_argument('--chunk-size', type=int)
+
+    def handle(self, *args, **options):
+        if options['output'] == '-':
+            output = nullcontext(sys.stdout)
+        else:
+            output = open(options['output'], 'w', encoding='utf-8')
+
+        with output as output:
+            output.writelines(export_recipes(options['chunk_size']))
@@ -0,0 +1,54 @@
+import json
+import sys
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.bulk import RecipeImporter
+
+
+class Command(BaseCommand):
+    help = 'Importing recipes from an NDJSON file in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='NDJSON file, "-" for stdin.')
+        parser.add_argument('--batch-size', type=int)
+        parser.add_argument(
+            '--start-line', type=int, default=1,
+            help='Line to resume a failed import from.'
+        )
+        parser.add_argument(
+            '--skip-invalid', action='store_true',
+            help='Import the valid rows of batches with invalid ones.'
+        )
+
+    def handle(self, *args, **options):
+        importer = RecipeImporter(
+            options['batch_size'], options['skip_invalid']
+        )
+        if options['path'] == '-':
+            lines = nullcontext(sys.stdin)
+        else:
+            lines = open(options['path'], encoding='utf-8')
+
+        imported = 0
+        with lines as lines:
+            for batch in importer.run(lines, options['start_line']):
+                imported += batch['imported']
+                for error in batch.get('errors', ()):
+                    self.stderr.write(
+                        f'Line {error["line"]}: '
+                        f'{json.dumps(error["errors"], ensure_ascii=False)}'
+                    )
+                if batch['status'] != 'imported':
+                    raise CommandError(
+                        f'Lines {batch["first_line"]}-{batch["last_line"]} '
+                        f'were not imported ({batch.get("error", "invalid")})'
+                        f'. Fix them and resume with '
+                        f'--start-line {batch["first_line"]}.'
+                    )
+                self.stdout.write(
+                    f'Lines {batch["first_line"]}-{batch["last_line"]}: '
+                    f'{batch["imported"]} recipes imported, '
+                    f'{imported} in total.'
+                )
@@ -0,0 +1,269 @@
+import json
+import re
+import statistics
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from itertools import cycle
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Recipe, Tag
+
+User = get_user_model()
+
+
+QUERIES_RE = re.compile(r'(\d+) queries')
+
+
+def summarize(durations, queries, elapsed=None):
+    """Latency percentiles in milliseconds, queries and throughput.
+
+    Concurrent runs pass their wall clock `elapsed` time for the
+    throughput.
+    """
+    cuts = statistics.quantiles(durations, n=100, method='inclusive')
+    total = sum(durations)
+    return {
+        'requests': len(durations),
+        'p50_ms': round(cuts[49] * 1000, 3),
+        'p95_ms': round(cuts[94] * 1000, 3),
+        'p99_ms': round(cuts[98] * 1000, 3),
+        'mean_ms': round(total / len(durations) * 1000, 3),
+        'max_ms': round(max(durations) * 1000, 3),
+        'queries_per_request': round(statistics.mean(queries), 2),
+        'requests_per_second': round(len(durations) / (elapsed or total), 2),
+    }
+
+
+def count_queries(response):
+    """Queries of a request as reported in its Server-Timing header,
+    which also covers queries made in other threads."""
+    match = QUERIES_RE.search(response.get('Server-Timing', ''))
+    return int(match.group(1)) if match else 0
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarking the main API endpoints in process and reporting '
+        'latency percentiles, queries per request and throughput, '
+        'sequentially or concurrently.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests', type=int, default=100,
+            help='Measured requests per scenario.'
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=5,
+            help='Unmeasured requests per scenario sent first.'
+        )
+        parser.add_argument(
+            '--user', type=int,
+            help='Id of the user to request as (default: most favorites).'
+        )
+        parser.add_argument(
+            '--scenario', action='append',
+            help='Run only the named scenario, can be repeated.'
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=1,
+            help='Requests in flight at once. Above 1 requests run in '
+                 'threads, each with its own connection, like gunicorn '
+                 'threads.'
+        )
+        parser.add_argument(
+            '--memory', action='store_true',
+            help='Report the peak Python memory per in-flight request. '
+                 'Tracing allocations slows the requests down.'
+        )
+        parser.add_argument(
+            '--output',
+            help='Write the JSON report to this file, "-" for stdout.'
+        )
+
+    def get_scenarios(self, names=None):
+        recipes = list(
+            Recipe.objects.order_by('?').values_list('id', flat=True)[:100]
+        )
+        tags = list(Tag.objects.values_list('slug', flat=True))
+        authors = list(
+            User.objects.annotate(total=Count('recipes'))
+            .order_by('-total').values_list('id', flat=True)[:20]
+        )
+        prefixes = sorted({
+            name[:2] for name in Ingredient.objects.order_by('?')
+            .values_list('name', flat=True)[:50]
+        })
+        if not (recipes and tags and authors and prefixes):
+            raise CommandError(
+                'Not enough data to benchmark, run seed_benchmark_data.'
+            )
+
+        scenarios = {
+            'recipe_list': cycle(['/api/recipes/']),
+            'recipe_list_favorited': cycle(['/api/recipes/?is_favorited=1']),
+            'recipe_list_in_cart': cycle([
+                '/api/recipes/?is_in_shopping_cart=1'
+            ]),
+            'recipe_list_tags': cycle(
+                f'/api/recipes/?tags={tag}' for tag in tags
+            ),
+            'recipe_list_author': cycle(
+                f'/api/recipes/?author={author}' for author in authors
+            ),
+            'recipe_list_cursor': cycle(['/api/recipes/?pagination=cursor']),
+            'recipe_detail': cycle(
+                f'/api/recipes/{recipe}/' for recipe in recipes
+            ),
+            'subscriptions': cycle([
+                '/api/users/subscriptions/?recipes_limit=3'
+            ]),
+            'shopping_cart_download': cycle([
+                '/api/recipes/download_shopping_cart/?format=pdf'
+            ]),
+            'ingredient_autocomplete': cycle(
+                f'/api/ingredients/?name={prefix}' for prefix in prefixes
+            ),
+        }
+        if not names:
+            return scenarios
+
+        unknown = set(names) - set(scenarios)
+        if unknown:
+            raise CommandError(
+                f'Unknown scenarios: {", ".join(sorted(unknown))}.'
+            )
+        return {
+            name: urls for name, urls in scenarios.items() if name in names
+        }
+
+    def request(self, client, url):
+        with CaptureQueriesContext(connection) as context:
+            started = time.perf_counter()
+            response = client.get(url)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            duration = time.perf_counter() - started
+        if response.status_code >= 400:
+            raise CommandError(f'{url} returned {response.status_code}.')
+        return duration, len(context.captured_queries)
+
+    def run_threads(self, user, urls, concurrency):
+        local = threading.local()
+
+        def send(url):
+            if not hasattr(local, 'client'):
+                local.client = APIClient()
+                local.client.force_authenticate(user)
+            started = time.perf_counter()
+            response = local.client.get(url)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            return self.finish(url, response, started)
+
+        with ThreadPoolExecutor(concurrency) as executor:
+            return list(executor.map(send, urls))
+
+    def finish(self, url, response, started):
+        duration = time.perf_counter() - started
+        if response.status_code >= 400:
+            raise CommandError(f'{url} returned {response.status_code}.')
+        self.threads = max(self.threads, threading.active_count())
+        return duration, count_queries(response)
+
+    def run_concurrent(self, user, urls, options):
+        """Send `urls` `--concurrency` at a time, return the results and
+        the wall clock time."""
+        concurrency = options['concurrency']
+        started = time.perf_counter()
+        results = self.run_threads(user, urls, concurrency)
+        return results, time.perf_counter() - started
+
+    def run_scenario(self, client, user, urls, options):
+        self.threads = threading.active_count()
+        if options['warmup']:
+            warmup = [next(urls) for _ in range(options['warmup'])]
+            if options['concurrency'] > 1:
+                self.run_concurrent(user, warmup, options)
+            else:
+                for url in warmup:
+                    self.request(client, url)
+
+        if options['memory']:
+            tracemalloc.start()
+        urls = [next(urls) for _ in range(options['requests'])]
+        elapsed = None
+        if options['concurrency'] > 1:
+            results, elapsed = self.run_concurrent(user, urls, options)
+        else:
+            results = [self.request(client, url) for url in urls]
+
+        durations, queries = zip(*results)
+        result = summarize(durations, queries, elapsed)
+        result['threads'] = self.threads
+        if options['memory']:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            result['peak_kib_per_request'] = round(
+                peak / 1024 / options['concurrency'], 1
+            )
+        return result
+
+    def handle(self, *args, **options):
+        if options['requests'] < 2:
+            raise CommandError('At least 2 requests per scenario are needed.')
+        if options['concurrency'] < 1:
+            raise CommandError('The concurrency must be at least 1.')
+
+        if options['user']:
+            user = User.objects.get(pk=options['user'])
+        else:
+            user = User.objects.annotate(
+                favorites_total=Count('favorites')
+            ).order_by('-favorites_total', 'pk').first()
+        if user is None:
+            raise CommandError('The database has no users, seed it first.')
+
+        client = APIClient()
+        client.force_authenticate(user)
+        scenarios = self.get_scenarios(options['scenario'])
+
+        report = {
+            'started_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'user': user.pk,
+            'concurrency': options['concurrency'],
+            'scenarios': {},
+        }
+        for name, urls in scenarios.items():
+            report['scenarios'][name] = self.run_scenario(
+                client, user, urls, options
+            )
+
+        output = json.dumps(report, indent=2)
+        if options['output'] == '-':
+            self.stdout.write(output)
+            return
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output)
+
+        for name, result in report['scenarios'].items():
+            self.stdout.write(
+                f'{name:<26} p50 {result["p50_ms"]:>8} ms  '
+                f'p95 {result["p95_ms"]:>8} ms  '
+                f'p99 {result["p99_ms"]:>8} ms  '
+                f'{result["queries_per_request"]:>6} queries  '
+                f'{result["requests_per_second"]:>8} req/s'
+                + (f'  {result["peak_kib_per_request"]:>8} KiB/request'
+                   if 'peak_kib_per_request' in result else '')
+            )
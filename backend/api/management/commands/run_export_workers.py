@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.export_jobs import run_worker
+from api.jobs import run_pool
+
+
+class Command(BaseCommand):
+    help = 'Rendering queued shopping cart exports in a pool of processes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int,
+            default=settings.SHOPPING_CART_EXPORT_WORKERS,
+            help='Number of worker processes.'
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help='Seconds to wait when the queue is empty.'
+        )
+        parser.add_argument(
+            '--burst', action='store_true',
+            help='Exit as soon as the queue is empty.'
+        )
+
+    def handle(self, *args, **options):
+        run_pool(
+            run_worker, (options['poll_interval'], options['burst']),
+            options['workers']
+        )
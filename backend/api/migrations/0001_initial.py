@@ -0,0 +1,40 @@
+# Generated by Django 4.1.4 on 2026-10-18 01:25
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingCartExport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('format', models.CharField(max_length=16, verbose_name='format')),
+                ('status', models.CharField(choices=[('pending', 'pending'), ('running', 'running'), ('done', 'done'), ('failed', 'failed')], default='pending', max_length=16, verbose_name='status')),
+                ('file', models.FileField(blank=True, upload_to='exports/', verbose_name='file')),
+                ('error', models.TextField(blank=True, verbose_name='error')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='creation date')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='start date')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='finish date')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cart_exports', to=settings.AUTH_USER_MODEL, verbose_name='user')),
+            ],
+            options={
+                'verbose_name': 'shopping cart export',
+                'verbose_name_plural': 'shopping cart exports',
+                'ordering': ('pk',),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='shoppingcartexport',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['created_at'], name='export_pending_idx'),
+        ),
+    ]
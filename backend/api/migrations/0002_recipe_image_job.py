@@ -0,0 +1,36 @@
+# Generated by Django 4.1.4 on 2026-10-18 01:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_recipe_image_renditions'),
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeImageJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'pending'), ('running', 'running'), ('done', 'done'), ('failed', 'failed')], default='pending', max_length=16, verbose_name='status')),
+                ('error', models.TextField(blank=True, verbose_name='error')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='creation date')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='start date')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='finish date')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='image_jobs', to='recipes.recipe', verbose_name='recipe')),
+            ],
+            options={
+                'verbose_name': 'recipe image job',
+                'verbose_name_plural': 'recipe image jobs',
+                'ordering': ('pk',),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='recipeimagejob',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['created_at'], name='image_job_pending_idx'),
+        ),
+    ]
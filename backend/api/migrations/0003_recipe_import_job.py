@@ -0,0 +1,42 @@
+# Generated by Django 4.1.4 on 2026-10-18 02:23
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0002_recipe_image_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeImportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'pending'), ('running', 'running'), ('done', 'done'), ('failed', 'failed')], default='pending', max_length=16, verbose_name='status')),
+                ('error', models.TextField(blank=True, verbose_name='error')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='creation date')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='start date')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='finish date')),
+                ('file', models.FileField(blank=True, upload_to='imports/', verbose_name='file')),
+                ('start_line', models.PositiveIntegerField(default=1, verbose_name='start line')),
+                ('skip_invalid', models.BooleanField(default=False, verbose_name='skip invalid rows')),
+                ('imported', models.PositiveIntegerField(default=0, verbose_name='imported recipes')),
+                ('batches', models.JSONField(default=list, verbose_name='batches')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recipe_imports', to=settings.AUTH_USER_MODEL, verbose_name='user')),
+            ],
+            options={
+                'verbose_name': 'recipe import job',
+                'verbose_name_plural': 'recipe import jobs',
+                'ordering': ('pk',),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='recipeimportjob',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['created_at'], name='import_job_pending_idx'),
+        ),
+    ]
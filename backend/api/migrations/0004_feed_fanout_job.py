@@ -0,0 +1,37 @@
+# Generated by Django 4.1.4 on 2026-10-18 02:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0014_recipe_updated_at_default'),
+        ('api', '0003_recipe_import_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedFanoutJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'pending'), ('running', 'running'), ('done', 'done'), ('failed', 'failed')], default='pending', max_length=16, verbose_name='status')),
+                ('error', models.TextField(blank=True, verbose_name='error')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='creation date')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='start date')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='finish date')),
+                ('last_user_id', models.BigIntegerField(default=0, verbose_name='last follower')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_jobs', to='recipes.recipe', verbose_name='recipe')),
+            ],
+            options={
+                'verbose_name': 'feed fan-out job',
+                'verbose_name_plural': 'feed fan-out jobs',
+                'ordering': ('pk',),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='feedfanoutjob',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['created_at'], name='feed_job_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,16 @@
+# Generated by Django 4.1.4 on 2026-10-18 02:51
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_feed_fanout_job'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='FeedFanoutJob',
+        ),
+    ]
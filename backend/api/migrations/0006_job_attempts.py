@@ -0,0 +1,40 @@
+# Generated by Django 4.1.4 on 2026-10-18 02:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_delete_feed_fanout_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipeimagejob',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='attempts'),
+        ),
+        migrations.AddField(
+            model_name='recipeimportjob',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='attempts'),
+        ),
+        migrations.AddField(
+            model_name='shoppingcartexport',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='attempts'),
+        ),
+        migrations.AddIndex(
+            model_name='recipeimagejob',
+            index=models.Index(condition=models.Q(('status', 'running')), fields=['started_at'], name='image_job_running_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipeimportjob',
+            index=models.Index(condition=models.Q(('status', 'running')), fields=['started_at'], name='import_job_running_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shoppingcartexport',
+            index=models.Index(condition=models.Q(('status', 'running')), fields=['started_at'], name='export_running_idx'),
+        ),
+    ]
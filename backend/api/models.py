@@ -0,0 +1,149 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import models
+from django.utils import timezone
+
+from recipes.models import Recipe
+
+User = get_user_model()
+
+
+class BackgroundJob(models.Model):
+    """Status and timestamps of a job processed by a worker pool."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, 'pending'),
+        (RUNNING, 'running'),
+        (DONE, 'done'),
+        (FAILED, 'failed'),
+    )
+
+    status = models.CharField(
+        max_length=16, choices=STATUSES, default=PENDING,
+        verbose_name='status'
+    )
+    error = models.TextField(blank=True, verbose_name='error')
+    created_at = models.DateTimeField(
+        auto_now_add=True, verbose_name='creation date'
+    )
+    started_at = models.DateTimeField(
+        null=True, blank=True, verbose_name='start date'
+    )
+    finished_at = models.DateTimeField(
+        null=True, blank=True, verbose_name='finish date'
+    )
+    attempts = models.PositiveSmallIntegerField(
+        default=0, verbose_name='attempts'
+    )
+
+    class Meta:
+        abstract = True
+
+
+class ShoppingCartExport(BackgroundJob):
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='cart_exports',
+        verbose_name='user'
+    )
+    format = models.CharField(max_length=16, verbose_name='format')
+    file = models.FileField(
+        upload_to='exports/', blank=True, verbose_name='file'
+    )
+
+    class Meta:
+        verbose_name = 'shopping cart export'
+        verbose_name_plural = 'shopping cart exports'
+        ordering = ('pk', )
+        indexes = [
+            models.Index(
+                fields=['created_at'], name='export_pending_idx',
+                condition=models.Q(status='pending'),
+            ),
+            models.Index(
+                fields=['started_at'], name='export_running_idx',
+                condition=models.Q(status='running'),
+            ),
+        ]
+
+    @classmethod
+    def expired(cls):
+        """Exports finished more than SHOPPING_CART_EXPORT_MAX_AGE ago."""
+        return cls.objects.filter(finished_at__lt=timezone.now() - timedelta(
+            seconds=settings.SHOPPING_CART_EXPORT_MAX_AGE
+        ))
+
+    def __str__(self):
+        return f'Export {self.pk} of {self.user_id} shopping cart'
+
+
+class RecipeImageJob(BackgroundJob):
+    recipe = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE, related_name='image_jobs',
+        verbose_name='recipe'
+    )
+
+    class Meta:
+        verbose_name = 'recipe image job'
+        verbose_name_plural = 'recipe image jobs'
+        ordering = ('pk', )
+        indexes = [
+            models.Index(
+                fields=['created_at'], name='image_job_pending_idx',
+                condition=models.Q(status='pending'),
+            ),
+            models.Index(
+                fields=['started_at'], name='image_job_running_idx',
+                condition=models.Q(status='running'),
+            ),
+        ]
+
+    def __str__(self):
+        return f'Images of recipe {self.recipe_id}'
+
+
+class RecipeImportJob(BackgroundJob):
+    """An NDJSON upload imported by a worker with api.bulk.RecipeImporter.
+
+    `batches` holds the report of every processed batch; the file is
+    released when the job finishes.
+    """
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='recipe_imports',
+        verbose_name='user'
+    )
+    file = models.FileField(
+        upload_to='imports/', blank=True, verbose_name='file'
+    )
+    start_line = models.PositiveIntegerField(
+        default=1, verbose_name='start line'
+    )
+    skip_invalid = models.BooleanField(
+        default=False, verbose_name='skip invalid rows'
+    )
+    imported = models.PositiveIntegerField(
+        default=0, verbose_name='imported recipes'
+    )
+    batches = models.JSONField(default=list, verbose_name='batches')
+
+    class Meta:
+        verbose_name = 'recipe import job'
+        verbose_name_plural = 'recipe import jobs'
+        ordering = ('pk', )
+        indexes = [
+            models.Index(
+                fields=['created_at'], name='import_job_pending_idx',
+                condition=models.Q(status='pending'),
+            ),
+            models.Index(
+                fields=['started_at'], name='import_job_running_idx',
+                condition=models.Q(status='running'),
+            ),
+        ]
+
+    def __str__(self):
+        return f'Recipe import {self.pk}'
@@ -1,5 +1,294 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import (Cursor, CursorPagination,
+                                       PageNumberPagination)
+
+from recipes import feed
+
+
+def estimate_count(queryset):
+    """Return the planner's row estimate for `queryset` on PostgreSQL.
+
+    Whole tables are estimated from pg_class.reltuples, filtered querysets
+    from EXPLAIN. Small estimates are replaced by an exact COUNT(*).
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                (queryset.model._meta.db_table, )
+            )
+            estimate = cursor.fetchone()[0]
+        else:
+            sql, params = queryset.query.sql_with_params()
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            estimate = cursor.fetchone()[0][0]['Plan']['Plan Rows']
+
+    if estimate < settings.PAGINATION_EXACT_COUNT_THRESHOLD:
+        return queryset.count()
+    return int(estimate)
+
+
+class EstimatedCountPaginator(Paginator):
+
+    @cached_property
+    def count(self):
+        return estimate_count(self.object_list)
+
+
+class UncountedPage(Page):
+
+    def __init__(self, object_list, number, paginator, has_next):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
+
+
+class UncountedPaginator(Paginator):
+    """Skip COUNT(*): fetch one extra row to learn if a next page exists."""
+
+    count = None
+    known_pages = 1
+
+    @property
+    def num_pages(self):
+        return self.known_pages
+
+    def page(self, number):
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and number > 1:
+            raise EmptyPage('That page contains no results')
+
+        has_next = len(rows) > self.per_page
+        self.known_pages = number + 1 if has_next else number
+        return UncountedPage(rows[:self.per_page], number, self, has_next)
+
+
+class KeysetPagination(CursorPagination):
+    """Cursor pagination on the whole `ordering` key.
+
+    The cursor holds the values of every ordering field of the first or
+    last row of the page, and the next page is read with a keyset
+    condition on all of them. The fields must be unique together (end
+    with the primary key), then ties on the leading field neither skip
+    nor repeat rows.
+    """
+    page_size_query_param = 'limit'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        # (field name, descending) in the order the page is read.
+        key = [
+            (name.lstrip('-'), name.startswith('-') != reverse)
+            for name in self.ordering
+        ]
+        if self.cursor is not None:
+            position = self.decode_position(request)
+            if len(position) != len(key):
+                raise NotFound(self.invalid_cursor_message)
+            try:
+                position = [
+                    queryset.model._meta.get_field(name).to_python(value)
+                    for (name, _), value in zip(key, position)
+                ]
+            except DjangoValidationError:
+                raise NotFound(self.invalid_cursor_message)
+            queryset = queryset.filter(self.get_keyset_filter(key, position))
+
+        rows = list(queryset.order_by(*(
+            f'-{name}' if descending else name for name, descending in key
+        ))[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.cursor is not None
+        return self.page
+
+    @staticmethod
+    def get_keyset_filter(key, position):
+        """Rows after `position` in the `key` order."""
+        keyset, equal = Q(), {}
+        for (name, descending), value in zip(key, position):
+            lookup = 'lt' if descending else 'gt'
+            keyset |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return keyset
+
+    def decode_position(self, request):
+        """Return the list of key values held by the cursor, if any."""
+        cursor = self.decode_cursor(request)
+        if cursor is None:
+            return None
+        try:
+            position = json.loads(cursor.position)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def encode_position(self, values, reverse=False):
+        # Not DjangoJSONEncoder: it cuts datetimes to milliseconds.
+        return self.encode_cursor(Cursor(
+            offset=0, reverse=reverse, position=json.dumps([
+                value.isoformat() if hasattr(value, 'isoformat') else value
+                for value in values
+            ])
+        ))
+
+    def get_key_values(self, row):
+        return [getattr(row, name.lstrip('-')) for name in self.ordering]
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_position(self.get_key_values(self.page[-1]))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_position(
+            self.get_key_values(self.page[0]), reverse=True
+        )
 
 
 class CustomPagination(PageNumberPagination):
+    """Page numbers by default, keyset cursors on `?pagination=cursor`.
+
+    `?count=estimate` replaces the exact count with the planner estimate,
+    `?count=none` leaves it out. Subclasses enable cursors by setting
+    `cursor_ordering`, which needs a matching index. Cursors are refused
+    with the `ranked_query_params` that order the results by rank.
+    """
     page_size_query_param = 'limit'
+    count_query_param = 'count'
+    mode_query_param = 'pagination'
+    cursor_ordering = None
+    ranked_query_params = ()
+
+    count_paginators = {
+        'exact': Paginator,
+        'estimate': EstimatedCountPaginator,
+        'none': UncountedPaginator,
+    }
+
+    cursor_paginator = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        mode = request.query_params.get(self.mode_query_param)
+        if self.cursor_ordering and mode == 'cursor':
+            ranked = [
+                param for param in self.ranked_query_params
+                if request.query_params.get(param)
+            ]
+            if ranked:
+                raise ValidationError({self.mode_query_param: [
+                    f'Cursor pagination is not available with '
+                    f'{", ".join(ranked)}, use page numbers.'
+                ]})
+            self.cursor_paginator = KeysetPagination()
+            self.cursor_paginator.ordering = self.cursor_ordering
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+
+        count = request.query_params.get(
+            self.count_query_param, settings.PAGINATION_COUNT_MODE
+        )
+        self.django_paginator_class = self.count_paginators.get(
+            count, Paginator
+        )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def to_html(self):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.to_html()
+        return super().to_html()
+
+
+class RecipePagination(CustomPagination):
+    cursor_ordering = ('-pub_date', '-id')
+    ranked_query_params = ('search', )
+
+
+class UserPagination(CustomPagination):
+    cursor_ordering = ('id', )
+
+
+class FeedPagination(KeysetPagination):
+    """Forward-only keyset pages of a timeline, see feed.read_timeline.
+
+    The cursor holds the publication date and id of the last recipe of
+    the page, there are no previous links.
+    """
+    ordering = ('-pub_date', '-recipe_id')
+
+    def paginate_timeline(self, request, user_id):
+        """Return the recipe ids of the requested page of a timeline."""
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        rows = feed.read_timeline(
+            user_id, self.page_size + 1, self.decode_position(request)
+        )
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return [recipe_id for recipe_id, _ in self.page]
+
+    def decode_position(self, request):
+        position = super().decode_position(request)
+        if position is None:
+            return None
+        try:
+            pub_date, recipe_id = position
+            position = parse_datetime(pub_date), int(recipe_id)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if position[0] is None:
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def get_key_values(self, row):
+        recipe_id, pub_date = row
+        return pub_date, recipe_id
+
+    def get_previous_link(self):
+        return None
@@ -0,0 +1,318 @@
+import struct
+import zlib
+from functools import cached_property, lru_cache
+from pathlib import Path
+
+PAGE_WIDTH = 595
+PAGE_HEIGHT = 842
+MARGIN = 50
+LEADING = 1.4
+
+
+class TrueTypeFont:
+    """Minimal TrueType reader: glyph ids and advance widths for text.
+
+    Only the tables needed to embed the font as a CID font are parsed.
+    """
+
+    def __init__(self, path):
+        self.data = Path(path).read_bytes()
+        self.tables = self._read_tables()
+
+        units_per_em, = struct.unpack('>H', self._table('head')[18:20])
+        self.scale = 1000 / units_per_em
+
+        hhea = self._table('hhea')
+        ascent, descent = struct.unpack('>hh', hhea[4:8])
+        self.ascent = round(ascent * self.scale)
+        self.descent = round(descent * self.scale)
+        number_of_metrics, = struct.unpack('>H', hhea[34:36])
+
+        hmtx = self._table('hmtx')
+        self.widths = [
+            round(struct.unpack('>H', hmtx[i * 4:i * 4 + 2])[0] * self.scale)
+            for i in range(number_of_metrics)
+        ]
+        self.cmap = self._read_cmap()
+
+    def _read_tables(self):
+        num_tables, = struct.unpack('>H', self.data[4:6])
+        tables = {}
+        for i in range(num_tables):
+            entry = self.data[12 + i * 16:28 + i * 16]
+            tag, _, offset, length = struct.unpack('>4sIII', entry)
+            tables[tag.decode('latin-1')] = (offset, length)
+        return tables
+
+    def _table(self, tag):
+        offset, length = self.tables[tag]
+        return self.data[offset:offset + length]
+
+    def _read_cmap(self):
+        cmap = self._table('cmap')
+        num_subtables, = struct.unpack('>H', cmap[2:4])
+        for i in range(num_subtables):
+            platform, encoding, offset = struct.unpack(
+                '>HHI', cmap[4 + i * 8:12 + i * 8]
+            )
+            unicode_bmp = (platform, encoding) in ((3, 1), (0, 3))
+            if unicode_bmp and struct.unpack(
+                '>H', cmap[offset:offset + 2]
+            )[0] == 4:
+                return self._read_cmap_format_4(cmap, offset)
+        raise ValueError('Font has no Unicode BMP character map.')
+
+    @staticmethod
+    def _read_cmap_format_4(cmap, offset):
+        seg_count = struct.unpack('>H', cmap[offset + 6:offset + 8])[0] // 2
+        ends_at = offset + 14
+        starts_at = ends_at + seg_count * 2 + 2
+        deltas_at = starts_at + seg_count * 2
+        ranges_at = deltas_at + seg_count * 2
+
+        def read(position, index, fmt='>H'):
+            return struct.unpack(
+                fmt, cmap[position + index * 2:position + index * 2 + 2]
+            )[0]
+
+        mapping = {}
+        for i in range(seg_count):
+            end, start = read(ends_at, i), read(starts_at, i)
+            delta, range_offset = read(deltas_at, i, '>h'), read(ranges_at, i)
+            for code in range(start, min(end, 0xFFFE) + 1):
+                if range_offset:
+                    position = (
+                        ranges_at + i * 2 + range_offset + (code - start) * 2
+                    )
+                    glyph = struct.unpack(
+                        '>H', cmap[position:position + 2]
+                    )[0]
+                    if glyph:
+                        glyph = (glyph + delta) & 0xFFFF
+                else:
+                    glyph = (code + delta) & 0xFFFF
+                if glyph:
+                    mapping[code] = glyph
+        return mapping
+
+    def glyph(self, char):
+        return self.cmap.get(ord(char), 0)
+
+    def width(self, glyph):
+        if glyph < len(self.widths):
+            return self.widths[glyph]
+        return self.widths[-1]
+
+    def text_width(self, text, size):
+        return sum(self.width(self.glyph(char)) for char in text) * size / 1000
+
+    @cached_property
+    def compressed(self):
+        return zlib.compress(self.data)
+
+
+@lru_cache(maxsize=4)
+def load_font(path):
+    return TrueTypeFont(path)
+
+
+class _Helvetica:
+    """Fallback when no TrueType font is available: Latin-1 text only."""
+
+    ascent = 718
+    descent = -207
+
+    @staticmethod
+    def text_width(text, size):
+        return len(text) * size * 0.5
+
+
+class PDFWriter:
+    """Lay out lines of text on A4 pages and stream the PDF bytes.
+
+    Lines are `(text, size)` pairs. With a TrueType font the text is
+    written as glyph ids of an embedded Identity-H CID font, so any
+    script covered by the font (e.g. Cyrillic) is rendered.
+    """
+
+    def __init__(self, font_path=None):
+        self.font = None
+        if font_path and Path(font_path).exists():
+            self.font = load_font(str(font_path))
+
+    @property
+    def metrics(self):
+        return self.font or _Helvetica
+
+    def wrap(self, text, size):
+        width = PAGE_WIDTH - 2 * MARGIN
+        indent = text[:len(text) - len(text.lstrip(' '))]
+        line = ''
+        for word in text.split():
+            candidate = f'{line} {word}' if line else word
+            if line and self.metrics.text_width(
+                indent + candidate, size
+            ) > width:
+                yield indent + line
+                line = word
+            else:
+                line = candidate
+        yield indent + line
+
+    def paginate(self, lines):
+        pages, page = [], []
+        y = PAGE_HEIGHT - MARGIN
+        for text, size in lines:
+            for part in self.wrap(text, size):
+                y -= size * LEADING
+                if y < MARGIN and page:
+                    pages.append(page)
+                    page, y = [], PAGE_HEIGHT - MARGIN - size * LEADING
+                page.append((part, size, y))
+        pages.append(page)
+        return pages
+
+    def encode(self, text):
+        if self.font is None:
+            encoded = text.encode('cp1252', errors='replace')
+            escaped = (
+                encoded.replace(b'\\', b'\\\\')
+                .replace(b'(', b'\\(').replace(b')', b'\\)')
+            )
+            return b'(' + escaped + b')'
+        glyphs = ''.join(
+            f'{self.font.glyph(char):04X}' for char in text
+        )
+        return f'<{glyphs}>'.encode()
+
+    def content(self, page):
+        commands = []
+        for text, size, y in page:
+            commands.append(
+                b'BT /F1 %d Tf %d %.2f Td ' % (size, MARGIN, y)
+                + self.encode(text) + b' Tj ET'
+            )
+        return b'\n'.join(commands)
+
+    def font_objects(self, used_text, first_id):
+        """Return the font resource objects, the Type0 font comes first."""
+        if self.font is None:
+            return [
+                b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica '
+                b'/Encoding /WinAnsiEncoding >>'
+            ]
+
+        font = self.font
+        cid_font, descriptor, font_file, to_unicode = range(
+            first_id + 1, first_id + 5
+        )
+        glyphs = {}
+        for char in set(used_text):
+            glyph = font.glyph(char)
+            if glyph:
+                glyphs[glyph] = char
+        widths = b' '.join(
+            b'%d [%d]' % (glyph, font.width(glyph)) for glyph in sorted(glyphs)
+        )
+        mappings = [
+            b'<%04X> <%s>' % (glyph, char.encode('utf-16-be').hex().encode())
+            for glyph, char in sorted(glyphs.items())
+        ]
+        cmap = (
+            b'/CIDInit /ProcSet findresource begin 12 dict begin begincmap\n'
+            b'/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) '
+            b'/Supplement 0 >> def\n/CMapName /Adobe-Identity-UCS def\n'
+            b'/CMapType 2 def\n1 begincodespacerange\n<0000> <FFFF>\n'
+            b'endcodespacerange\n'
+        )
+        for start in range(0, len(mappings), 100):
+            chunk = mappings[start:start + 100]
+            cmap += b'%d beginbfchar\n' % len(chunk)
+            cmap += b'\n'.join(chunk) + b'\nendbfchar\n'
+        cmap += (
+            b'endcmap\nCMapName currentdict /CMap defineresource pop\n'
+            b'end\nend'
+        )
+        compressed = font.compressed
+
+        return [
+            b'<< /Type /Font /Subtype /Type0 /BaseFont /Embedded '
+            b'/Encoding /Identity-H /DescendantFonts [%d 0 R] '
+            b'/ToUnicode %d 0 R >>' % (cid_font, to_unicode),
+            b'<< /Type /Font /Subtype /CIDFontType2 /BaseFont /Embedded '
+            b'/CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) '
+            b'/Supplement 0 >> /FontDescriptor %d 0 R '
+            b'/CIDToGIDMap /Identity /W [%s] >>' % (descriptor, widths),
+            b'<< /Type /FontDescriptor /FontName /Embedded /Flags 32 '
+            b'/FontBBox [0 %d 1000 %d] /ItalicAngle 0 /Ascent %d '
+            b'/Descent %d /CapHeight %d /StemV 80 /FontFile2 %d 0 R >>' % (
+                font.descent, font.ascent, font.ascent, font.descent,
+                font.ascent, font_file,
+            ),
+            self.stream(compressed, b'/Length1 %d' % len(font.data)),
+            self.stream(zlib.compress(cmap)),
+        ]
+
+    @staticmethod
+    def stream(data, extra=b''):
+        return (
+            b'<< /Length %d /Filter /FlateDecode %s>>\nstream\n' % (
+                len(data), extra + b' ' if extra else b''
+            ) + data + b'\nendstream'
+        )
+
+    def render(self, lines):
+        """Yield the PDF document in chunks, one object at a time."""
+        lines = list(lines)
+        pages = self.paginate(lines)
+        used_text = ''.join(text for text, _ in lines)
+
+        font_id = 3
+        font_objects = self.font_objects(used_text, font_id)
+        first_page_id = font_id + len(font_objects)
+        page_ids = [first_page_id + i * 2 for i in range(len(pages))]
+
+        objects = [
+            b'<< /Type /Catalog /Pages 2 0 R >>',
+            b'<< /Type /Pages /Kids [%s] /Count %d >>' % (
+                b' '.join(b'%d 0 R' % page_id for page_id in page_ids),
+                len(pages),
+            ),
+            *font_objects,
+        ]
+
+        offsets = []
+        position = 0
+
+        def emit(number, body):
+            nonlocal position
+            chunk = b'%d 0 obj\n' % number + body + b'\nendobj\n'
+            offsets.append(position)
+            position += len(chunk)
+            return chunk
+
+        header = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+        position = len(header)
+        yield header
+
+        for number, body in enumerate(objects, start=1):
+            yield emit(number, body)
+
+        for page_id, page in zip(page_ids, pages):
+            yield emit(page_id, (
+                b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] '
+                b'/Resources << /Font << /F1 %d 0 R >> >> '
+                b'/Contents %d 0 R >>' % (
+                    PAGE_WIDTH, PAGE_HEIGHT, font_id, page_id + 1
+                )
+            ))
+            yield emit(
+                page_id + 1, self.stream(zlib.compress(self.content(page)))
+            )
+
+        xref = [b'xref\n0 %d\n0000000000 65535 f \n' % (len(offsets) + 1)]
+        xref += [b'%010d 00000 n \n' % offset for offset in offsets]
+        yield b''.join(xref) + (
+            b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+            % (len(offsets) + 1, position)
+        )
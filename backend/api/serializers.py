@@ -1,16 +1,26 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.db import transaction
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
 
+from api.exports import get_exporters
+from api.instrumentation import TimedSerializerMixin
+from api.models import RecipeImportJob, ShoppingCartExport
+from api.uploads import (load_upload_token, make_upload_token,
+                         save_uploaded_image)
+from recipes import feed, shopping_list
 from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingCart, Subscription, Tag)
+                            ShoppingCart, ShoppingListItem, Subscription, Tag)
 
 User = get_user_model()
 
 
-class CustomUserSerializer(UserSerializer):
+class CustomUserSerializer(TimedSerializerMixin, UserSerializer):
     is_subscribed = serializers.SerializerMethodField()
 
     class Meta(UserSerializer.Meta):
@@ -21,6 +31,8 @@ class CustomUserSerializer(UserSerializer):
         )
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
         if request.user.is_authenticated:
             return request.user.following.filter(author=obj).exists()
@@ -36,7 +48,7 @@ class CustomUserCreateSerializer(UserCreateSerializer):
         )
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Tag
@@ -64,20 +76,75 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
         return value
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeImageField(Base64ImageField):
+    """Base64 image or the token of an image posted to recipes/images/."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) and not data.startswith('data:'):
+            name = load_upload_token(data, self.context['request'].user)
+            if name is not None:
+                return name
+        return super().to_internal_value(data)
+
+
+class RecipeImageUploadSerializer(serializers.Serializer):
+    image = serializers.ImageField()
+
+    def validate_image(self, value):
+        width, height = value.image.size
+        if width * height > settings.RECIPE_IMAGE_MAX_PIXELS:
+            raise serializers.ValidationError(
+                f'Image is too large: {width}x{height}.'
+            )
+        return value
+
+    def create(self, validated_data):
+        name = save_uploaded_image(validated_data['image'])
+        return {
+            'image': name,
+            'token': make_upload_token(name, self.context['request'].user),
+        }
+
+    def to_representation(self, instance):
+        return {
+            'image': self.context['request'].build_absolute_uri(
+                default_storage.url(instance['image'])
+            ),
+            'token': instance['token'],
+        }
+
+
+class RenditionField(serializers.ImageField):
+    """URL of a resized copy of the recipe image.
+
+    Falls back to the original image until the rendition is ready.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def get_attribute(self, instance):
+        return super().get_attribute(instance) or instance.image
+
+
+class RecipeSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     author = CustomUserSerializer(read_only=True)
     ingredients = RecipeIngredientSerializer(
         source='ingredients_set', many=True
     )
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
-    image = Base64ImageField()
+    image = RecipeImageField()
+    image_small = RenditionField()
+    image_medium = RenditionField()
 
     class Meta:
         model = Recipe
         fields = (
             'id', 'tags', 'author', 'ingredients', 'is_favorited',
-            'is_in_shopping_cart', 'name', 'image', 'text', 'cooking_time',
+            'is_in_shopping_cart', 'name', 'image', 'image_small',
+            'image_medium', 'text', 'cooking_time',
         )
 
     def validate_cooking_time(self, value):
@@ -88,22 +155,29 @@ class RecipeSerializer(serializers.ModelSerializer):
         return value
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request = self.context.get('request')
         if request.user.is_authenticated:
             return obj.favorites.filter(user=request.user).exists()
         return False
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request = self.context.get('request')
         if request.user.is_authenticated:
             return obj.shopping_cart.filter(user=request.user).exists()
         return False
 
     def to_representation(self, instance):
+        if hasattr(instance, 'is_author_subscribed'):
+            instance.author.is_subscribed = instance.is_author_subscribed
         data = super().to_representation(instance)
         data['tags'] = TagSerializer(instance.tags, many=True).data
         return data
 
+    @transaction.atomic
     def create(self, validated_data):
         request = self.context.get('request')
         tags = validated_data.pop('tags')
@@ -125,13 +199,17 @@ class RecipeSerializer(serializers.ModelSerializer):
         RecipeIngredient.objects.bulk_create(
             recipe_ingredient_set, ignore_conflicts=True
         )
+        feed.fan_out([recipe.pk])
 
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         if validated_data:
             instance.name = validated_data.get('name', instance.name)
-            instance.image = validated_data.get('image', instance.image)
+            if 'image' in validated_data:
+                instance.image = validated_data['image']
+                instance.clear_renditions()
             instance.text = validated_data.get('text', instance.text)
             instance.cooking_time = validated_data.get(
                 'cooking_time', instance.cooking_time
@@ -142,31 +220,138 @@ class RecipeSerializer(serializers.ModelSerializer):
                 instance.tags.set(tags)
 
             if 'ingredients_set' in validated_data:
-                ingredients_set = validated_data.pop('ingredients_set')
-                instance.ingredients_set.all().delete()
-                recipe_ingredient_set = []
-                for item in ingredients_set:
-                    ingredient = item.get('ingredient')['id']
-                    amount = item.get('amount')
-                    recipe_ingredient_set.append(
-                        RecipeIngredient(
-                            recipe=instance, ingredient=ingredient,
-                            amount=amount
-                        )
-                    )
-                RecipeIngredient.objects.bulk_create(
-                    recipe_ingredient_set, ignore_conflicts=True
+                self.update_ingredients(
+                    instance, validated_data.pop('ingredients_set')
                 )
 
             instance.save()
         return instance
 
+    @staticmethod
+    def update_ingredients(recipe, ingredients_set):
+        """Bring the recipe ingredients in line with `ingredients_set`.
+
+        Only the difference is written: changed amounts with one
+        bulk_update, new ingredients with one bulk_create and removed ones
+        with one DELETE.
+        """
+        amounts = {}
+        for item in ingredients_set:
+            amounts.setdefault(item['ingredient']['id'].pk, item['amount'])
+
+        existing = {
+            item.ingredient_id: item for item in recipe.ingredients_set.all()
+        }
+        old_amounts = {pk: item.amount for pk, item in existing.items()}
+
+        changed = []
+        for pk, item in existing.items():
+            if pk in amounts and item.amount != amounts[pk]:
+                item.amount = amounts[pk]
+                changed.append(item)
+        removed = [
+            item.pk for pk, item in existing.items() if pk not in amounts
+        ]
+        created = [
+            RecipeIngredient(recipe=recipe, ingredient_id=pk, amount=amount)
+            for pk, amount in amounts.items() if pk not in existing
+        ]
+
+        if removed:
+            RecipeIngredient.objects.filter(pk__in=removed).delete()
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ['amount'])
+        if created:
+            RecipeIngredient.objects.bulk_create(created)
+        shopping_list.change_recipe(recipe.pk, old_amounts, amounts)
+
+
+class ImportImageField(Base64ImageField):
+    """Base64 image or the name of a file already in the media storage.
+
+    Referencing copied media files skips decoding and re-encoding them.
+    """
+
+    def to_internal_value(self, data):
+        if (isinstance(data, str) and len(data) <= 255
+                and not data.startswith('data:')):
+            try:
+                if default_storage.exists(data):
+                    return data
+            except SuspiciousFileOperation:
+                pass
+        return super().to_internal_value(data)
+
+
+class RecipeImportIngredientSerializer(RecipeIngredientSerializer):
+    id = serializers.IntegerField()
+
+    class Meta(RecipeIngredientSerializer.Meta):
+        fields = ('id', 'amount', )
+
+    def validate_id(self, value):
+        if value not in self.context['ingredients']:
+            raise serializers.ValidationError(
+                f'Invalid pk "{value}" - object does not exist.'
+            )
+        return value
+
+
+class RecipeImportSerializer(RecipeSerializer):
+    """Validates a bulk import row with the recipe rules.
+
+    Related ids are checked against sets loaded once per batch (see
+    `api.bulk.RecipeImporter`) instead of a query per value.
+    """
+    author = serializers.IntegerField()
+    tags = serializers.ListField(
+        child=serializers.IntegerField(), allow_empty=False
+    )
+    ingredients = RecipeImportIngredientSerializer(many=True)
+    image = ImportImageField()
+    pub_date = serializers.DateTimeField(required=False)
+
+    class Meta(RecipeSerializer.Meta):
+        fields = (
+            'author', 'tags', 'ingredients', 'name', 'image', 'text',
+            'cooking_time', 'pub_date',
+        )
+
+    def validate_author(self, value):
+        if value not in self.context['authors']:
+            raise serializers.ValidationError(
+                f'Invalid pk "{value}" - object does not exist.'
+            )
+        return value
+
+    def validate_tags(self, value):
+        unknown = set(value) - self.context['tags']
+        if unknown:
+            raise serializers.ValidationError(
+                f'Invalid pk "{min(unknown)}" - object does not exist.'
+            )
+        return list(dict.fromkeys(value))
+
+    def validate_ingredients(self, value):
+        ingredients = [item['id'] for item in value]
+        if len(set(ingredients)) != len(ingredients):
+            raise serializers.ValidationError(
+                'Ingredients must not repeat.'
+            )
+        return value
+
 
-class CommonRecipeSerializer(serializers.ModelSerializer):
+class CommonRecipeSerializer(TimedSerializerMixin,
+                             serializers.ModelSerializer):
+    image_small = RenditionField()
+    image_medium = RenditionField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time', )
+        fields = (
+            'id', 'name', 'image', 'image_small', 'image_medium',
+            'cooking_time',
+        )
 
 
 class ShoppingCartSerializer(serializers.ModelSerializer):
@@ -183,6 +368,19 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
         )
 
 
+class ShoppingListItemSerializer(serializers.ModelSerializer):
+    id = serializers.ReadOnlyField(source='ingredient.id')
+    name = serializers.ReadOnlyField(source='ingredient.name')
+    measurement_unit = serializers.ReadOnlyField(
+        source='ingredient.measurement_unit'
+    )
+    amount = serializers.ReadOnlyField(source='total_amount')
+
+    class Meta:
+        model = ShoppingListItem
+        fields = ('id', 'name', 'measurement_unit', 'amount', )
+
+
 class FavoriteSerializer(serializers.ModelSerializer):
 
     class Meta:
@@ -199,7 +397,7 @@ class FavoriteSerializer(serializers.ModelSerializer):
 
 class SubscriptionSerializer(CustomUserSerializer):
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.ReadOnlyField()
 
     class Meta:
         model = User
@@ -209,6 +407,9 @@ class SubscriptionSerializer(CustomUserSerializer):
         )
 
     def get_recipes(self, obj):
+        if hasattr(obj, 'limited_recipes'):
+            return CommonRecipeSerializer(obj.limited_recipes, many=True).data
+
         recipes = obj.recipes.all()
         recipes_limit = (
             self.context.get('request').query_params.get('recipes_limit')
@@ -218,9 +419,6 @@ class SubscriptionSerializer(CustomUserSerializer):
 
         return CommonRecipeSerializer(recipes, many=True).data
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
-
 
 class SubscribeSerializer(serializers.ModelSerializer):
 
@@ -244,8 +442,47 @@ class SubscribeSerializer(serializers.ModelSerializer):
         return value
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(TimedSerializerMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Ingredient
         fields = ('id', 'name', 'measurement_unit', )
+
+
+class ShoppingCartExportSerializer(serializers.ModelSerializer):
+    format = serializers.CharField(
+        default=settings.SHOPPING_CART_DEFAULT_FORMAT
+    )
+
+    class Meta:
+        model = ShoppingCartExport
+        fields = (
+            'id', 'format', 'status', 'file', 'error', 'created_at',
+            'finished_at',
+        )
+        read_only_fields = (
+            'status', 'file', 'error', 'created_at', 'finished_at',
+        )
+
+    def validate_format(self, value):
+        exporters = get_exporters()
+        if value not in exporters:
+            raise serializers.ValidationError(
+                f'Available formats: {", ".join(exporters)}.'
+            )
+        return value
+
+
+class RecipeImportJobSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = RecipeImportJob
+        fields = (
+            'id', 'start_line', 'skip_invalid', 'status', 'imported',
+            'batches', 'error', 'created_at', 'finished_at',
+        )
+        read_only_fields = (
+            'status', 'imported', 'batches', 'error', 'created_at',
+            'finished_at',
+        )
+        extra_kwargs = {'start_line': {'min_value': 1}}
@@ -0,0 +1,77 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from api.authentication import token_user_cache
+from api.catalog import ingredients_catalog, recipes_catalog, tags_catalog
+from api.image_jobs import enqueue_recipe_images
+from api.ingredient_index import refresh_ingredients
+from api.instrumentation import instrument_connection
+from recipes.models import Ingredient, Recipe, Tag
+from recipes.signals import catalog_changed
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(catalog_changed, sender=Tag)
+def invalidate_tags_catalog(**kwargs):
+    transaction.on_commit(tags_catalog.invalidate)
+
+
+@receiver(post_save, sender=Ingredient)
+def refresh_saved_ingredient(instance, **kwargs):
+    transaction.on_commit(lambda: refresh_ingredients(saved=instance))
+
+
+@receiver(post_delete, sender=Ingredient)
+def refresh_deleted_ingredient(instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: refresh_ingredients(deleted=pk))
+
+
+@receiver(catalog_changed, sender=Ingredient)
+def invalidate_ingredients_catalog(**kwargs):
+    transaction.on_commit(ingredients_catalog.invalidate)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(catalog_changed, sender=Recipe)
+def invalidate_recipes_catalog(**kwargs):
+    # Recipe ingredients are only written along with a saved recipe.
+    transaction.on_commit(recipes_catalog.invalidate)
+
+
+@receiver(post_save, sender=Recipe)
+def enqueue_recipe_image(instance, raw, **kwargs):
+    if not raw and instance.image and not instance.image_small:
+        enqueue_recipe_images([instance.pk])
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_tokens(instance, **kwargs):
+    # Password changes, deactivation and profile edits all save the user.
+    # Again after commit, so no request caches the old row meanwhile.
+    pk = instance.pk
+    token_user_cache.invalidate_user(pk)
+    transaction.on_commit(lambda: token_user_cache.invalidate_user(pk))
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_token(instance, **kwargs):
+    # Logout and token destroy delete the token.
+    key = instance.key
+    token_user_cache.invalidate([key])
+    transaction.on_commit(lambda: token_user_cache.invalidate([key]))
+
+
+@receiver(connection_created)
+def record_connection_queries(connection, **kwargs):
+    instrument_connection(connection)
@@ -0,0 +1,617 @@
+import json
+import os
+import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from api.authentication import token_user_cache
+from api.catalog import ingredients_catalog, recipes_catalog, tags_catalog
+from api.export_jobs import claim_next_export
+from api.import_jobs import claim_next_import, process_import
+from api.jobs import finish_job
+from api.models import RecipeImportJob, ShoppingCartExport
+from api.serializers import RecipeSerializer
+from recipes import feed
+from recipes.models import (Favorite, FeedEntry, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingCart, ShoppingListItem,
+                            Subscription, Tag)
+from recipes.signals import catalog_changed
+from users.models import User
+
+
+class APITestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass',
+            first_name='Reader', last_name='Reader'
+        )
+        cls.token = Token.objects.create(user=cls.user)
+        cls.tags = Tag.objects.bulk_create([
+            Tag(name=f'tag {i}', color=f'#00000{i}', slug=f'tag-{i}')
+            for i in range(3)
+        ])
+        cls.ingredients = Ingredient.objects.bulk_create([
+            Ingredient(name=f'ingredient {i}', measurement_unit='g')
+            for i in range(5)
+        ])
+        cls.authors = [
+            User.objects.create_user(
+                username=f'author{i}', email=f'author{i}@example.com',
+                password='pass', first_name='Author', last_name=str(i)
+            )
+            for i in range(3)
+        ]
+        for i in range(12):
+            cls.create_recipe(cls.authors[i % 3], f'recipe {i}')
+        for author in cls.authors[:2]:
+            Subscription.objects.create(user=cls.user, author=author)
+        Favorite.objects.create(
+            user=cls.user, recipe=Recipe.objects.first()
+        )
+
+    @classmethod
+    def create_recipe(cls, author, name, ingredients=None):
+        recipe = Recipe.objects.create(
+            author=author, name=name, text='text', cooking_time=10,
+            image='img/recipe.png'
+        )
+        recipe.tags.set(cls.tags[:2])
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=10)
+            for ingredient in (ingredients or cls.ingredients[:3])
+        ])
+        return recipe
+
+    def setUp(self):
+        cache.clear()
+        # The catalogs keep their version in the process too, a version
+        # rechecked after the clear would change the ETags mid-test.
+        for catalog in (tags_catalog, ingredients_catalog, recipes_catalog):
+            catalog.clear_local()
+        token_user_cache.clear_local()
+        self.anonymous = Client()
+        self.client = Client(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+
+class RecipeListETagTests(APITestCase):
+    """The list ETag follows the recipes version, no aggregate query."""
+
+    def get_etag(self):
+        response = self.anonymous.get('/api/recipes/')
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def assert_etag_changes(self, change):
+        etag = self.get_etag()
+        self.assertEqual(
+            self.anonymous.get(
+                '/api/recipes/', HTTP_IF_NONE_MATCH=etag
+            ).status_code,
+            304
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        self.assertNotEqual(self.get_etag(), etag)
+
+    def test_recipe_saved(self):
+        recipe = Recipe.objects.first()
+        recipe.name = 'renamed'
+        self.assert_etag_changes(recipe.save)
+
+    def test_recipe_deleted(self):
+        self.assert_etag_changes(Recipe.objects.first().delete)
+
+    def test_recipe_tags_changed(self):
+        recipe = Recipe.objects.first()
+        self.assert_etag_changes(lambda: recipe.tags.set(self.tags[2:]))
+
+    def test_author_changed(self):
+        author = self.authors[0]
+        author.first_name = 'Renamed'
+        self.assert_etag_changes(author.save)
+
+    def test_version_is_rechecked(self):
+        etag = self.get_etag()
+        # As if bumped by another process.
+        cache.set(recipes_catalog.version_key, recipes_catalog.version() + 1)
+        self.assertNotEqual(self.get_etag(), etag)
+
+
+class RecipeDetailETagTests(APITestCase):
+
+    def test_edit_changes_validators(self):
+        recipe = Recipe.objects.first()
+        url = f'/api/recipes/{recipe.pk}/'
+        response = self.anonymous.get(url)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+
+        token = Token.objects.create(user=recipe.author)
+        author = Client(HTTP_AUTHORIZATION=f'Token {token.key}')
+        response = author.patch(
+            url, {'name': 'renamed'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+
+        # Last-Modified has a resolution of a second, the ETag decides.
+        response = self.anonymous.get(
+            url, HTTP_IF_NONE_MATCH=etag,
+            HTTP_IF_MODIFIED_SINCE=last_modified
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['name'], 'renamed')
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class TokenAuthenticationTests(APITestCase):
+
+    def test_writes_do_not_save_a_stale_user(self):
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+        # Changed behind the cached snapshot, e.g. by another process.
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+        response = self.client.patch(
+            '/api/users/me/', {'first_name': 'Renamed'},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual(user.first_name, 'Renamed')
+        self.assertTrue(user.is_staff)
+
+    def test_deactivation_revokes_cached_tokens(self):
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 401)
+
+    def test_local_copy_expires(self):
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+        # Deactivated by another process: only the shared cache is cleared.
+        cache.clear()
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+        expired = time.monotonic() + settings.AUTH_TOKEN_CACHE_TTL
+        with mock.patch('api.authentication.time.monotonic') as monotonic:
+            monotonic.return_value = expired
+            self.assertEqual(
+                self.client.get('/api/users/me/').status_code, 401
+            )
+
+
+class CounterTests(APITestCase):
+
+    def test_unfavorite_with_counter_out_of_line(self):
+        recipe = Recipe.objects.first()
+        Recipe.objects.filter(pk=recipe.pk).update(favorites_count=0)
+        response = self.client.delete(f'/api/recipes/{recipe.pk}/favorite/')
+        self.assertEqual(response.status_code, 204)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 0)
+
+
+class RecipeCursorTests(APITestCase):
+
+    def read_pages(self, url, link='next'):
+        recipe_ids = []
+        while url:
+            response = self.anonymous.get(url).json()
+            recipe_ids += [recipe['id'] for recipe in response['results']]
+            url = response[link]
+        return recipe_ids
+
+    def test_tied_pub_dates(self):
+        pub_date = timezone.now()
+        Recipe.objects.update(pub_date=pub_date)
+        expected = list(Recipe.objects.order_by('-id').values_list(
+            'pk', flat=True
+        ))
+
+        first = self.anonymous.get(
+            '/api/recipes/?pagination=cursor&limit=5'
+        ).json()
+        # A tie published between the requests sorts before the cursor.
+        Recipe.objects.filter(
+            pk=self.create_recipe(self.authors[0], 'new').pk
+        ).update(pub_date=pub_date)
+        recipe_ids = [recipe['id'] for recipe in first['results']]
+        recipe_ids += self.read_pages(first['next'])
+        self.assertEqual(recipe_ids, expected)
+
+        expected = list(Recipe.objects.order_by('-id').values_list(
+            'pk', flat=True
+        ))
+        last = self.anonymous.get(
+            '/api/recipes/?pagination=cursor&limit=5'
+        ).json()
+        while last['next']:
+            last = self.anonymous.get(last['next']).json()
+        previous = self.read_pages(last['previous'], link='previous')
+        self.assertEqual(
+            sorted(previous, reverse=True), expected[:-len(last['results'])]
+        )
+
+    def test_search_refuses_cursor(self):
+        response = self.anonymous.get(
+            '/api/recipes/?pagination=cursor&search=recipe'
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class IngredientSearchTests(APITestCase):
+
+    def search(self, name):
+        response = self.anonymous.get(f'/api/ingredients/?name={name}')
+        self.assertEqual(response.status_code, 200)
+        return [item['name'] for item in response.json()]
+
+    def test_prefix_matches_first(self):
+        Ingredient.objects.create(name='dient', measurement_unit='g')
+        self.assertEqual(self.search('dient')[0], 'dient')
+        self.assertEqual(len(self.search('dient')), 6)
+
+    @override_settings(INGREDIENT_SEARCH_LIMIT=2)
+    def test_substring_matches_are_capped(self):
+        self.assertEqual(len(self.search('dient')), 2)
+
+    def test_bulk_load_refreshes_index(self):
+        self.assertEqual(self.search('salt'), [])
+        # Loaded by `add_ingredients` in another process.
+        Ingredient.objects.bulk_create([
+            Ingredient(name='salt', measurement_unit='g')
+        ])
+        with self.captureOnCommitCallbacks(execute=True):
+            catalog_changed.send(sender=Ingredient)
+        self.assertEqual(self.search('salt'), ['salt'])
+
+
+class FeedTests(APITestCase):
+
+    def test_feed_is_read_only(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/recipes/feed/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['results'])
+        self.assertEqual(FeedEntry.objects.filter(user=self.user).count(), 8)
+        writes = [
+            query['sql'] for query in queries
+            if query['sql'].split()[0] in ('INSERT', 'UPDATE', 'DELETE')
+        ]
+        self.assertEqual(writes, [])
+
+    def read_feed(self, limit):
+        recipe_ids, url = [], f'/api/recipes/feed/?limit={limit}'
+        while url:
+            response = self.client.get(url).json()
+            recipe_ids += [recipe['id'] for recipe in response['results']]
+            url = response['next']
+        return recipe_ids
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS=0)
+    def test_popular_authors_are_merged_on_read(self):
+        popular = self.authors[0]
+        recipe = self.create_recipe(popular, 'popular')
+        feed.fan_out([recipe.pk])
+        self.assertFalse(FeedEntry.objects.filter(recipe=recipe).exists())
+
+        self.assertEqual(self.read_feed(3), list(
+            Recipe.objects.filter(author__in=self.authors[:2]).order_by(
+                '-pub_date', '-id'
+            ).values_list('pk', flat=True)
+        ))
+
+    @override_settings(FEED_TIMELINE_LENGTH=3)
+    def test_fan_out_trims_timelines(self):
+        recipe = self.create_recipe(self.authors[0], 'new')
+        feed.fan_out([recipe.pk])
+        latest = Recipe.objects.filter(author__in=self.authors[:2])[:3]
+        self.assertEqual(
+            list(FeedEntry.objects.filter(user=self.user).values_list(
+                'recipe_id', flat=True
+            )),
+            [recipe.pk for recipe in latest]
+        )
+
+
+class ImportJobTests(APITestCase):
+
+    @override_settings(RECIPE_IMPORT_BATCH_SIZE=1)
+    def test_batch_and_progress_commit_together(self):
+        image = default_storage.save('img/import.png', ContentFile(b'png'))
+        self.addCleanup(default_storage.delete, image)
+        row = {
+            'author': self.authors[0].pk, 'name': 'imported', 'text': 'text',
+            'cooking_time': 10, 'image': image, 'tags': [self.tags[0].pk],
+            'ingredients': [{'id': self.ingredients[0].pk, 'amount': 1}],
+        }
+        job = RecipeImportJob.objects.create(user=self.user)
+        job.file.save('import.ndjson', ContentFile(
+            (json.dumps(row) + '\n').encode() * 2
+        ))
+        self.addCleanup(default_storage.delete, job.file.name)
+        count = Recipe.objects.count()
+        job = claim_next_import()
+
+        # Saving the progress of the second batch fails.
+        lookups = []
+        filter_jobs = RecipeImportJob.objects.filter
+
+        def filter_or_fail(*args, **kwargs):
+            lookups.append(kwargs)
+            if len(lookups) == 2:
+                raise DatabaseError('lost')
+            return filter_jobs(*args, **kwargs)
+
+        with mock.patch.object(RecipeImportJob.objects, 'filter',
+                               side_effect=filter_or_fail):
+            process_import(job)
+        job.refresh_from_db()
+        self.assertEqual(job.status, RecipeImportJob.FAILED)
+        self.assertEqual(job.imported, 1)
+        self.assertEqual(
+            [batch['status'] for batch in job.batches], ['imported', 'failed']
+        )
+        self.assertEqual(Recipe.objects.count(), count + 1)
+
+
+class JobClaimTests(APITestCase):
+
+    def create_export(self, **fields):
+        return ShoppingCartExport.objects.create(
+            user=self.user, format='txt', **fields
+        )
+
+    def make_stale(self, export):
+        ShoppingCartExport.objects.filter(pk=export.pk).update(
+            started_at=timezone.now() - timedelta(
+                seconds=settings.SHOPPING_CART_EXPORT_TIMEOUT + 1
+            )
+        )
+
+    def test_stale_jobs_are_claimed_before_queued_ones(self):
+        queued = self.create_export()
+        stale = self.create_export(status=ShoppingCartExport.RUNNING)
+        self.make_stale(stale)
+        self.assertEqual(claim_next_export(), stale)
+        self.assertEqual(claim_next_export(), queued)
+        stale.refresh_from_db()
+        self.assertEqual(stale.attempts, 1)
+
+    def test_stale_jobs_fail_after_max_attempts(self):
+        export = self.create_export(
+            status=ShoppingCartExport.RUNNING,
+            attempts=settings.BACKGROUND_JOB_MAX_ATTEMPTS
+        )
+        self.make_stale(export)
+        with self.assertLogs('api.jobs', 'ERROR'):
+            self.assertIsNone(claim_next_export())
+        export.refresh_from_db()
+        self.assertEqual(export.status, ShoppingCartExport.FAILED)
+
+    def test_late_outcome_is_dropped(self):
+        self.create_export()
+        late = claim_next_export()
+        self.make_stale(late)
+        claimed = claim_next_export()
+        self.assertEqual(claimed.attempts, 2)
+
+        late.status = ShoppingCartExport.DONE
+        with self.assertLogs('api.jobs', 'WARNING'):
+            self.assertFalse(finish_job(late))
+        self.assertTrue(finish_job(claimed))
+
+
+class MediaReleaseTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = self.settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+
+    def save_old_file(self, name):
+        name = default_storage.save(name, ContentFile(name.encode()))
+        written = time.time() - settings.MEDIA_GARBAGE_MIN_AGE - 1
+        os.utime(default_storage.path(name), (written, written))
+        return name
+
+    def test_last_reference_deletes_the_file(self):
+        image = self.save_old_file('img/shared.png')
+        first, second = Recipe.objects.all()[:2]
+        Recipe.objects.filter(pk__in=[first.pk, second.pk]).update(
+            image=image
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            Recipe.objects.get(pk=first.pk).delete()
+        self.assertTrue(default_storage.exists(image))
+
+        second.refresh_from_db()
+        with self.captureOnCommitCallbacks(execute=True):
+            second.image = 'img/recipe.png'
+            second.save()
+        self.assertFalse(default_storage.exists(image))
+
+    def test_fresh_files_are_left_to_the_collector(self):
+        image = default_storage.save('img/new.png', ContentFile(b'new'))
+        recipe = Recipe.objects.first()
+        Recipe.objects.filter(pk=recipe.pk).update(image=image)
+        with self.captureOnCommitCallbacks(execute=True):
+            Recipe.objects.get(pk=recipe.pk).delete()
+        self.assertTrue(default_storage.exists(image))
+
+    def test_collector_expires_exports(self):
+        name = self.save_old_file('exports/cart.txt')
+        export = ShoppingCartExport.objects.create(
+            user=self.user, format='txt', file=name,
+            status=ShoppingCartExport.DONE, finished_at=timezone.now()
+        )
+        call_command('collect_media_garbage', stdout=StringIO())
+        self.assertTrue(default_storage.exists(name))
+
+        ShoppingCartExport.objects.filter(pk=export.pk).update(
+            finished_at=timezone.now() - timedelta(
+                seconds=settings.SHOPPING_CART_EXPORT_MAX_AGE + 1
+            )
+        )
+        call_command('collect_media_garbage', stdout=StringIO())
+        self.assertFalse(ShoppingCartExport.objects.exists())
+        self.assertFalse(default_storage.exists(name))
+
+
+class QueryCountTests(APITestCase):
+    """Reads take a fixed number of queries, whatever the page size.
+
+    Authenticated requests start with the token lookup: the token cache
+    is cleared before every test.
+    """
+
+    def assert_num_queries(self, client, url, num):
+        with self.assertNumQueries(num):
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_recipe_list(self):
+        # Count, recipes, tags and ingredients; the flags of the user.
+        for limit in (2, 10):
+            with self.subTest(limit=limit):
+                cache.clear()
+                token_user_cache.clear_local()
+                self.assert_num_queries(
+                    self.anonymous, f'/api/recipes/?limit={limit}', 4
+                )
+                self.assert_num_queries(
+                    self.client, f'/api/recipes/?limit={limit}', 6
+                )
+
+    def test_recipe_detail(self):
+        # Validators, recipe, tags and ingredients.
+        url = f'/api/recipes/{Recipe.objects.first().pk}/'
+        self.assert_num_queries(self.anonymous, url, 4)
+        self.assert_num_queries(self.client, url, 5)
+
+    def test_subscriptions(self):
+        # Count, authors and their limited recipes.
+        for url in ('/api/users/subscriptions/',
+                    '/api/users/subscriptions/?recipes_limit=1'):
+            with self.subTest(url=url):
+                cache.clear()
+                token_user_cache.clear_local()
+                self.assert_num_queries(self.client, url, 4)
+
+
+class UpdateIngredientsTests(APITestCase):
+    """Editing ingredients writes only the difference, in bulk, and moves
+    the shopping lists of the carts by the same amounts."""
+
+    def setUp(self):
+        super().setUp()
+        first, second, third = self.ingredients[:3]
+        self.recipe = self.create_recipe(self.authors[0], 'edited')
+        other = self.create_recipe(self.authors[1], 'other', [third])
+        for recipe in (self.recipe, other):
+            ShoppingCart.objects.create(user=self.user, recipe=recipe)
+        self.assertEqual(
+            self.get_shopping_list(),
+            {first.pk: 10, second.pk: 10, third.pk: 20}
+        )
+
+    def get_shopping_list(self):
+        return dict(ShoppingListItem.objects.filter(
+            user=self.user
+        ).values_list('ingredient_id', 'total_amount'))
+
+    def update_ingredients(self, amounts):
+        """Return the statements run for the new `amounts`, by kind."""
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        with CaptureQueriesContext(connection) as queries:
+            RecipeSerializer.update_ingredients(recipe, [
+                {'ingredient': {'id': ingredient}, 'amount': amount}
+                for ingredient, amount in amounts
+            ])
+        self.assertEqual(
+            dict(recipe.ingredients_set.values_list('ingredient', 'amount')),
+            {ingredient.pk: amount for ingredient, amount in amounts}
+        )
+        return [
+            query['sql'].split()[0] for query in queries
+            if not query['sql'].startswith(('SAVEPOINT', 'RELEASE'))
+        ]
+
+    def test_no_change(self):
+        first, second, third = self.ingredients[:3]
+        statements = self.update_ingredients(
+            [(first, 10), (second, 10), (third, 10)]
+        )
+        # Only the current ingredients are read.
+        self.assertEqual(statements, ['SELECT'])
+        self.assertEqual(
+            self.get_shopping_list(),
+            {first.pk: 10, second.pk: 10, third.pk: 20}
+        )
+
+    def test_amounts_changed(self):
+        first, second, third = self.ingredients[:3]
+        statements = self.update_ingredients(
+            [(first, 15), (second, 10), (third, 5)]
+        )
+        # One bulk_update; the lists get an upsert for the increments, an
+        # update and a cleanup for the decrements.
+        self.assertEqual(
+            statements, ['SELECT', 'UPDATE', 'INSERT', 'UPDATE', 'DELETE']
+        )
+        self.assertEqual(
+            self.get_shopping_list(),
+            {first.pk: 15, second.pk: 10, third.pk: 15}
+        )
+
+    def test_ingredient_added(self):
+        first, second, third, fourth = self.ingredients[:4]
+        statements = self.update_ingredients(
+            [(first, 10), (second, 10), (third, 10), (fourth, 7)]
+        )
+        # One bulk_create and the upsert of the lists.
+        self.assertEqual(statements, ['SELECT', 'INSERT', 'INSERT'])
+        self.assertEqual(
+            self.get_shopping_list(),
+            {first.pk: 10, second.pk: 10, third.pk: 20, fourth.pk: 7}
+        )
+
+    def test_ingredients_removed(self):
+        first, second, third = self.ingredients[:3]
+        statements = self.update_ingredients([(first, 10)])
+        # One DELETE; the lists get an update and a cleanup.
+        self.assertEqual(statements, ['SELECT', 'DELETE', 'UPDATE', 'DELETE'])
+        # The other recipe in the cart keeps its share of the third one.
+        self.assertEqual(
+            self.get_shopping_list(), {first.pk: 10, third.pk: 10}
+        )
+
+    def test_mixed_change(self):
+        first, second, third, fourth = self.ingredients[:4]
+        statements = self.update_ingredients(
+            [(first, 12), (third, 10), (fourth, 3)]
+        )
+        self.assertEqual(statements, [
+            'SELECT', 'DELETE', 'UPDATE', 'INSERT',
+            'INSERT', 'UPDATE', 'DELETE',
+        ])
+        self.assertEqual(
+            self.get_shopping_list(),
+            {first.pk: 12, third.pk: 20, fourth.pk: 3}
+        )
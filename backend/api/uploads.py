@@ -0,0 +1,93 @@
+from django.conf import settings
+from django.core import signing
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.parsers import FileUploadParser
+
+from recipes.models import Recipe
+
+UPLOAD_TOKEN_SALT = 'api.uploads.recipe-image'
+
+
+class PayloadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Image is too large.'
+    default_code = 'payload_too_large'
+
+
+class LimitedUploadHandler(TemporaryFileUploadHandler):
+    """Stream uploads to a temporary file, aborting over the size cap.
+
+    At most one chunk of the body is held in memory at a time.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.chunk_size = settings.RECIPE_IMAGE_UPLOAD_CHUNK_SIZE
+        self.max_size = settings.RECIPE_IMAGE_UPLOAD_MAX_SIZE
+
+    def handle_raw_input(self, input_data, meta, content_length, *args,
+                         **kwargs):
+        if content_length and content_length > self.max_size:
+            raise PayloadTooLarge()
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > self.max_size:
+            # Closing the temporary file deletes it.
+            self.file.close()
+            raise PayloadTooLarge()
+        return super().receive_data_chunk(raw_data, start)
+
+
+class ImageUploadParser(FileUploadParser):
+    """Raw image request body, e.g. `Content-Type: image/jpeg`.
+
+    Without a Content-Disposition file name the extension is taken from
+    the content type.
+    """
+    media_type = 'image/*'
+
+    def get_filename(self, stream, media_type, parser_context):
+        subtype = media_type.split(';')[0].split('/')[-1].strip()
+        return super().get_filename(
+            stream, media_type, parser_context
+        ) or f'upload.{subtype}'
+
+
+def save_uploaded_image(file):
+    """Store a validated upload as a recipe image, return its name.
+
+    The extension comes from the format Pillow detected, not the name
+    given by the client.
+    """
+    field = Recipe._meta.get_field('image')
+    name = f'upload.{file.image.format.lower()}'
+    return field.storage.save(
+        field.generate_filename(None, name), file,
+        max_length=field.max_length
+    )
+
+
+def make_upload_token(name, user):
+    return signing.dumps(
+        {'name': name, 'user': user.pk}, salt=UPLOAD_TOKEN_SALT
+    )
+
+
+def load_upload_token(token, user):
+    """Return the image name of a token issued to `user`, None if invalid.
+
+    Tokens expire together with the grace period of
+    `collect_media_garbage`, so the file of a valid token still exists.
+    """
+    try:
+        payload = signing.loads(
+            token, salt=UPLOAD_TOKEN_SALT,
+            max_age=settings.RECIPE_IMAGE_UPLOAD_TOKEN_MAX_AGE
+        )
+    except signing.BadSignature:
+        return None
+    if payload.get('user') != getattr(user, 'pk', None):
+        return None
+    return payload['name']
@@ -2,8 +2,9 @@ from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
 from api.views import (CustomUserViewSet, FavoriteViewSet, IngredientViewSet,
-                       RecipeViewSet, ShoppingCartViewSet, SubscriptionViewSet,
-                       TagViewSet)
+                       RecipeImportJobViewSet, RecipeViewSet,
+                       ShoppingCartExportViewSet, ShoppingCartViewSet,
+                       SubscriptionViewSet, TagViewSet, metrics)
 
 router = DefaultRouter()
 
@@ -13,6 +14,23 @@ router.register('recipes', RecipeViewSet, basename='recipes')
 router.register('ingredients', IngredientViewSet, basename='ingredients')
 
 urlpatterns = [
+    path('_metrics', metrics),
+    path(
+        'recipes/shopping_cart/exports/', ShoppingCartExportViewSet.as_view(
+            {'post': 'create'}
+        )
+    ),
+    path(
+        'recipes/shopping_cart/exports/<int:pk>/',
+        ShoppingCartExportViewSet.as_view({'get': 'retrieve'})
+    ),
+    path(
+        'recipes/import/', RecipeImportJobViewSet.as_view({'post': 'create'})
+    ),
+    path(
+        'recipes/import/<int:pk>/',
+        RecipeImportJobViewSet.as_view({'get': 'retrieve'})
+    ),
     path(
         'recipes/<int:pk>/shopping_cart/', ShoppingCartViewSet.as_view(
             {'post': 'create', 'delete': 'destroy'}
@@ -1,31 +1,125 @@
+import hashlib
+import io
+import shutil
+import tempfile
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.core.files import File
+from django.db import transaction
+from django.db.models import (BooleanField, Count, Exists, F, Max, OuterRef,
+                              Prefetch, Subquery, Value, Window,
+                              prefetch_related_objects)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from django.template import loader
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.crypto import constant_time_compare
+from django.utils.http import http_date
 from django_filters import rest_framework as filters
 from djoser.views import UserViewSet
-from pdfkit import from_string
-from rest_framework import status, viewsets
+from rest_framework import serializers, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.mixins import (CreateModelMixin, DestroyModelMixin,
                                    ListModelMixin, RetrieveModelMixin)
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import (SAFE_METHODS, IsAdminUser,
+                                        IsAuthenticated)
 from rest_framework.response import Response
 
-from api.filters import IngredientFilter, RecipeFilter
+from api.bulk import export_recipes
+from api.catalog import ingredients_catalog, recipes_catalog, tags_catalog
+from api.exports import export_shopping_cart, get_exporters
+from api.filters import RecipeFilter
+from api.ingredient_index import ingredient_index
+from api.instrumentation import request_metrics
+from api.models import RecipeImportJob, ShoppingCartExport
+from api.negotiation import IgnoreFormatContentNegotiation
+from api.pagination import FeedPagination, RecipePagination, UserPagination
 from api.permissions import IsAdminModeratorOwnerOrReadOnly
 from api.serializers import (CommonRecipeSerializer, FavoriteSerializer,
-                             IngredientSerializer, RecipeSerializer,
-                             ShoppingCartSerializer, SubscribeSerializer,
+                             IngredientSerializer, RecipeImageUploadSerializer,
+                             RecipeImportJobSerializer, RecipeSerializer,
+                             ShoppingCartExportSerializer,
+                             ShoppingCartSerializer,
+                             ShoppingListItemSerializer, SubscribeSerializer,
                              SubscriptionSerializer, TagSerializer)
-from recipes.models import (Favorite, Ingredient, Recipe, ShoppingCart,
+from api.uploads import ImageUploadParser, LimitedUploadHandler
+from foodgram.db_router import has_replica, is_sticky, replica_reads
+from recipes import similarity
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, ShoppingListItem, SimilarRecipe,
                             Subscription, Tag)
 
 User = get_user_model()
 
 
+def get_recipes_limit(request):
+    recipes_limit = request.query_params.get('recipes_limit')
+    if recipes_limit and recipes_limit.isdigit():
+        return int(recipes_limit)
+    return None
+
+
+def annotate_subscribed_authors(queryset):
+    return queryset.annotate(
+        is_subscribed=Value(True, output_field=BooleanField()),
+    ).order_by('pk')
+
+
+def get_limited_recipes(authors, recipes_limit=None):
+    """Recipes of `authors`, at most `recipes_limit` latest of each.
+
+    The limit is applied per author with ROW_NUMBER() OVER (PARTITION BY
+    author), so all authors are served by a single query.
+    """
+    recipes = Recipe.objects.filter(author__in=authors)
+    if recipes_limit is None:
+        return recipes
+    ranked = recipes.annotate(
+        position=Window(
+            RowNumber(),
+            partition_by=F('author'),
+            order_by=(F('pub_date').desc(), F('pk').desc()),
+        )
+    ).values('pk', 'position')
+    sql, params = ranked.query.sql_with_params()
+    return Recipe.objects.filter(pk__in=RawSQL(
+        f'SELECT ranked.id FROM ({sql}) ranked WHERE ranked.position <= %s',
+        (*params, recipes_limit)
+    ))
+
+
+def prefetch_limited_recipes(authors, recipes_limit=None):
+    """Attach the `get_limited_recipes` of every author to it."""
+    prefetch_related_objects(authors, Prefetch(
+        'recipes', queryset=get_limited_recipes(authors, recipes_limit),
+        to_attr='limited_recipes'
+    ))
+
+
+def metrics(request):
+    """Export the request metrics of this process for Prometheus.
+
+    Disabled unless METRICS_TOKEN is set.
+    """
+    token = settings.METRICS_TOKEN
+    if not token:
+        return HttpResponse(status=status.HTTP_403_FORBIDDEN)
+    if not constant_time_compare(
+        request.headers.get('Authorization', ''), f'Bearer {token}'
+    ):
+        return HttpResponse(status=status.HTTP_401_UNAUTHORIZED)
+    return HttpResponse(
+        request_metrics.export(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
+
+
 class CustomUserViewSet(UserViewSet):
+    pagination_class = UserPagination
 
     @action(["get", "put", "patch", "delete"], detail=False,
             permission_classes=[IsAuthenticated, ])
@@ -35,59 +129,393 @@ class CustomUserViewSet(UserViewSet):
     @action(detail=False, methods=['GET', ],
             permission_classes=[IsAuthenticated, ])
     def subscriptions(self, request):
-        following_users = User.objects.filter(followers__user=request.user)
+        following_users = annotate_subscribed_authors(
+            User.objects.filter(followers__user=request.user)
+        )
         serializer = SubscriptionSerializer
         context = {'request': request}
         page = self.paginate_queryset(following_users)
+        prefetch_limited_recipes(page, get_recipes_limit(request))
         serializer = serializer(page, context=context, many=True)
         return self.get_paginated_response(serializer.data)
 
 
-class TagViewSet(ListModelMixin, RetrieveModelMixin, viewsets.GenericViewSet):
+def get_flags_fingerprint(user):
+    """Counts and latest ids of the favorites, cart and subscriptions of a
+    user: any change to them changes the recipe flags of the user."""
+    fingerprint = {}
+    for name, model in (('favorites', Favorite), ('cart', ShoppingCart),
+                        ('subscriptions', Subscription)):
+        rows = model.objects.filter(user=OuterRef('pk')).order_by().values(
+            'user'
+        )
+        fingerprint[f'{name}_count'] = Subquery(
+            rows.annotate(value=Count('pk')).values('value')
+        )
+        fingerprint[f'{name}_last'] = Subquery(
+            rows.annotate(value=Max('pk')).values('value')
+        )
+    return User.objects.filter(pk=user.pk).values(**fingerprint).get()
+
+
+def annotate_recipe_flags(queryset, user):
+    """Annotate the favorite, cart and subscription flags of `user`."""
+    if user.is_authenticated:
+        return queryset.annotate(
+            is_favorited=Exists(
+                Favorite.objects.filter(user=user, recipe=OuterRef('pk'))
+            ),
+            is_in_shopping_cart=Exists(
+                ShoppingCart.objects.filter(user=user, recipe=OuterRef('pk'))
+            ),
+            is_author_subscribed=Exists(
+                Subscription.objects.filter(
+                    user=user, author=OuterRef('author')
+                )
+            ),
+        )
+
+    false = Value(False, output_field=BooleanField())
+    return queryset.annotate(
+        is_favorited=false,
+        is_in_shopping_cart=false,
+        is_author_subscribed=false,
+    )
+
+
+def get_recipe_etag(action, kwargs, query_params, user, validators,
+                    catalogs):
+    """Return the ETag and Last-Modified of a recipe response.
+
+    `validators` hold what the response depends on besides the query
+    string: the recipes version for lists, the modification date of the
+    recipe for details and, for users, their flags. The tag and
+    ingredient catalogs are embedded, so their `catalogs` versions are
+    part of the ETag too. Last-Modified is only given when it describes
+    the response alone: a recipe seen anonymously.
+    """
+    etag = '"{}"'.format(hashlib.md5(repr((
+        action, sorted(kwargs.items()), sorted(query_params.lists()),
+        user.pk, sorted(validators.items()), catalogs,
+    )).encode()).hexdigest())
+    last_modified = None
+    if action == 'retrieve' and not user.is_authenticated:
+        last_modified = int(max(
+            validators['updated_at'].timestamp(), *catalogs
+        ))
+    return etag, last_modified
+
+
+def patch_recipe_response(response, user, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    if user.is_authenticated:
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        patch_cache_control(
+            response, public=True, max_age=settings.RECIPE_CACHE_MAX_AGE
+        )
+    patch_vary_headers(response, ('Authorization', ))
+    return response
+
+
+def get_catalog_etag(catalog, version, action, kwargs, query_params):
+    """Return the cache key and ETag of a catalog response."""
+    key = '{}:{}:{}'.format(
+        action,
+        ','.join(f'{k}={v}' for k, v in sorted(kwargs.items())),
+        '&'.join(sorted(query_params.urlencode().split('&'))),
+    )
+    etag = '"{}"'.format(hashlib.md5(
+        f'{catalog.name}:{version}:{key}'.encode()
+    ).hexdigest())
+    return key, etag
+
+
+class ReplicaReadMixin:
+    """Run the safe requests of `replica_actions` on the replica database.
+
+    Users who have just written something keep reading from the primary
+    to see their own changes (see ReplicaStickinessMiddleware).
+    """
+    replica_actions = ('list', 'retrieve')
+    replica_token = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if (not has_replica() or request.method not in SAFE_METHODS
+                or self.action not in self.replica_actions):
+            return
+        user = request.user
+        if not (user.is_authenticated and is_sticky(user.pk)):
+            self.replica_token = replica_reads.set(True)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if self.replica_token is not None:
+            replica_reads.reset(self.replica_token)
+            self.replica_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class CachedCatalogMixin:
+    """Serve list/retrieve from a catalog cache with ETag/Last-Modified."""
+    catalog = None
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def get_cached_response(self, handler, request, *args, **kwargs):
+        version = self.catalog.version()
+        key, etag = get_catalog_etag(
+            self.catalog, version, self.action, kwargs, request.query_params
+        )
+        last_modified = int(version)
+
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = Response(self.catalog.get_or_set(
+                key, lambda: handler(request, *args, **kwargs).data
+            ))
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+
+
+class TagViewSet(ReplicaReadMixin, CachedCatalogMixin, ListModelMixin,
+                 RetrieveModelMixin, viewsets.GenericViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
+    catalog = tags_catalog
 
 
-class IngredientViewSet(ListModelMixin, RetrieveModelMixin,
+class IngredientViewSet(ReplicaReadMixin, CachedCatalogMixin,
+                        ListModelMixin, RetrieveModelMixin,
                         viewsets.GenericViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
-    filter_backends = (filters.DjangoFilterBackend, )
-    filterset_class = IngredientFilter
     pagination_class = None
+    catalog = ingredients_catalog
 
+    def list(self, request, *args, **kwargs):
+        if not request.query_params.get('name'):
+            return super().list(request, *args, **kwargs)
+        return self.get_cached_response(self.search, request, *args, **kwargs)
 
-class RecipeViewSet(viewsets.ModelViewSet):
+    def search(self, request, *args, **kwargs):
+        limit = request.query_params.get('limit')
+        limit = int(limit) if limit and limit.isdigit() else None
+        return Response(
+            ingredient_index.search(request.query_params['name'], limit)
+        )
+
+
+class RecipeViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
     filter_backends = (filters.DjangoFilterBackend, )
     filterset_class = RecipeFilter
+    pagination_class = RecipePagination
     permission_classes = [IsAdminModeratorOwnerOrReadOnly, ]
     http_method_names = ['get', 'post', 'patch', 'delete']
+    replica_actions = (
+        'list', 'retrieve', 'feed', 'similar', 'recommended'
+    )
+
+    def list(self, request, *args, **kwargs):
+        validators = {'recipes': recipes_catalog.version()}
+        if request.user.is_authenticated:
+            validators.update(get_flags_fingerprint(request.user))
+        return self.get_validated_response(
+            validators, super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        validators = self.get_queryset().filter(pk=pk).values(
+            'updated_at', 'is_favorited', 'is_in_shopping_cart',
+            'is_author_subscribed'
+        ).first() if pk.isdigit() else None
+        if validators is None:
+            return super().retrieve(request, *args, **kwargs)
+        return self.get_validated_response(
+            validators, super().retrieve, request, *args, **kwargs
+        )
+
+    def get_validated_response(self, validators, handler, request, *args,
+                               **kwargs):
+        """Answer 304 without serializing when the validators still match,
+        see get_recipe_etag."""
+        user = request.user
+        etag, last_modified = get_recipe_etag(
+            self.action, kwargs, request.query_params, user, validators,
+            (tags_catalog.version(), ingredients_catalog.version())
+        )
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        return patch_recipe_response(response, user, etag, last_modified)
+
+    def get_queryset(self):
+        return annotate_recipe_flags(
+            Recipe.objects.select_related('author').prefetch_related(
+                'tags',
+                Prefetch(
+                    'ingredients_set',
+                    queryset=RecipeIngredient.objects.select_related(
+                        'ingredient'
+                    )
+                ),
+            ),
+            self.request.user
+        )
+
+    @action(detail=False, methods=['POST', ], url_path='images',
+            permission_classes=[IsAuthenticated, ],
+            parser_classes=[MultiPartParser, ImageUploadParser])
+    def upload_image(self, request):
+        request.upload_handlers = [LimitedUploadHandler(request)]
+        # Multipart forms send the `image` field, raw bodies a `file`.
+        files = request.FILES
+        serializer = RecipeImageUploadSerializer(
+            data={'image': files.get('image', files.get('file'))},
+            context={'request': request}
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['GET', ], url_path='export',
+            permission_classes=[IsAdminUser, ])
+    def export_ndjson(self, request):
+        return StreamingHttpResponse(
+            export_recipes(), content_type='application/x-ndjson'
+        )
+
+    @action(detail=False, methods=['GET', ],
+            permission_classes=[IsAuthenticated, ],
+            pagination_class=FeedPagination)
+    def feed(self, request):
+        recipe_ids = self.paginator.paginate_timeline(
+            request, request.user.pk
+        )
+        return self.get_paginated_response(
+            self.serialize_in_order(recipe_ids)
+        )
+
+    @action(detail=True, methods=['GET', ])
+    def similar(self, request, pk=None):
+        recipe = get_object_or_404(Recipe, pk=pk)
+        recipe_ids = SimilarRecipe.objects.filter(
+            recipe=recipe
+        ).values_list('similar_id', flat=True)[:self.get_similar_limit()]
+        return Response(self.serialize_in_order(recipe_ids))
+
+    @action(detail=False, methods=['GET', ],
+            permission_classes=[IsAuthenticated, ])
+    def recommended(self, request):
+        return Response(self.serialize_in_order(
+            similarity.recommend(request.user.pk, self.get_similar_limit())
+        ))
+
+    def get_similar_limit(self):
+        limit = self.request.query_params.get('limit')
+        if limit and limit.isdigit():
+            return min(int(limit), settings.SIMILAR_RECIPES_TOP_K)
+        return settings.REST_FRAMEWORK['PAGE_SIZE']
+
+    def serialize_in_order(self, recipe_ids):
+        """Serialized recipes of `recipe_ids`, in that order."""
+        recipe_ids = list(recipe_ids)
+        recipes = self.get_queryset().in_bulk(recipe_ids)
+        return self.get_serializer([
+            recipes[recipe_id] for recipe_id in recipe_ids
+            if recipe_id in recipes
+        ], many=True).data
 
     @action(detail=False, methods=['GET', ],
             permission_classes=[IsAuthenticated, ])
+    def shopping_cart(self, request):
+        items = ShoppingListItem.objects.filter(
+            user=request.user
+        ).select_related('ingredient').order_by('ingredient__name')
+        serializer = ShoppingListItemSerializer(items, many=True)
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['GET', ],
+            permission_classes=[IsAuthenticated, ],
+            content_negotiation_class=IgnoreFormatContentNegotiation)
     def download_shopping_cart(self, request):
-        user = request.user
-        recipes = Recipe.objects.filter(shopping_cart__user=user)
-        ingredients = Ingredient.objects.filter(
-            recipes_set__recipe__shopping_cart__user=user
-        ).annotate(
-            total_amount=Sum('recipes_set__amount')
-        )
-        context = {
-            'user': user,
-            'recipes': recipes,
-            'ingredients': ingredients
-        }
+        exporters = get_exporters()
+        export_format = request.query_params.get(
+            'format', settings.SHOPPING_CART_DEFAULT_FORMAT
+        )
+        if export_format not in exporters:
+            raise serializers.ValidationError({
+                'format': f'Available formats: {", ".join(exporters)}.'
+            })
+
+        exporter = exporters[export_format]
+        response = StreamingHttpResponse(
+            export_shopping_cart(request.user, exporter),
+            content_type=exporter.content_type
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_cart.{exporter.extension}"'
+        )
+        return response
+
 
-        html = loader.render_to_string('shopping_cart.html', context=context)
-        output = from_string(html, output_path=False)
-        response = HttpResponse(content_type='application/pdf')
-        response.write(output)
+class ShoppingCartExportViewSet(CreateModelMixin, RetrieveModelMixin,
+                                viewsets.GenericViewSet):
+    serializer_class = ShoppingCartExportSerializer
+    permission_classes = [IsAuthenticated, ]
+
+    def get_queryset(self):
+        return ShoppingCartExport.objects.filter(user=self.request.user)
+
+    def create(self, request, *args, **kwargs):
+        response = super().create(request, *args, **kwargs)
+        response.status_code = status.HTTP_202_ACCEPTED
         return response
 
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+
+class RecipeImportJobViewSet(RetrieveModelMixin, viewsets.GenericViewSet):
+    """Queue an NDJSON upload for import and report its progress."""
+    queryset = RecipeImportJob.objects.all()
+    serializer_class = RecipeImportJobSerializer
+    permission_classes = [IsAdminUser, ]
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data={
+            'start_line': request.query_params.get('start_line', 1),
+            'skip_invalid': request.query_params.get('skip_invalid') == 'true',
+        })
+        serializer.is_valid(raise_exception=True)
+        # Streamed to disk, the body is never held in memory.
+        with tempfile.TemporaryFile() as upload:
+            shutil.copyfileobj(request.stream or io.BytesIO(), upload)
+            upload.seek(0)
+            serializer.save(
+                user=request.user, file=File(upload, name='import.ndjson')
+            )
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
 
 class BaseViewSet(CreateModelMixin, DestroyModelMixin,
                   viewsets.GenericViewSet):
@@ -97,6 +525,7 @@ class BaseViewSet(CreateModelMixin, DestroyModelMixin,
     related_field = None
     related_serializer = None
 
+    @transaction.atomic
     def create(self, request, pk):
         related_object = get_object_or_404(self.related_class, pk=pk)
         data = {
@@ -110,11 +539,16 @@ class BaseViewSet(CreateModelMixin, DestroyModelMixin,
         headers = self.get_success_headers(serializer.data)
 
         return Response(
-            self.related_serializer(
-                related_object, context={'request': request}
-            ).data, status=status.HTTP_201_CREATED, headers=headers
+            self.get_related_data(related_object),
+            status=status.HTTP_201_CREATED, headers=headers
         )
 
+    def get_related_data(self, related_object):
+        return self.related_serializer(
+            related_object, context={'request': self.request}
+        ).data
+
+    @transaction.atomic
     def destroy(self, request, pk):
         related_object = get_object_or_404(self.related_class, pk=pk)
         data = {
@@ -159,3 +593,10 @@ class SubscriptionViewSet(ListModelMixin, BaseViewSet):
     related_class = User
     related_field = 'author'
     related_serializer = SubscriptionSerializer
+
+    def get_related_data(self, related_object):
+        author = annotate_subscribed_authors(
+            User.objects.filter(pk=related_object.pk)
+        ).get()
+        prefetch_limited_recipes([author], get_recipes_limit(self.request))
+        return super().get_related_data(author)
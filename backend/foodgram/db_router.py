@@ -0,0 +1,76 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+
+REPLICA = 'replica'
+
+# Set while a view that tolerates replication lag runs its reads.
+replica_reads = ContextVar('replica_reads', default=False)
+
+
+def has_replica():
+    return REPLICA in settings.DATABASES
+
+
+@contextmanager
+def use_replica():
+    token = replica_reads.set(has_replica())
+    try:
+        yield
+    finally:
+        replica_reads.reset(token)
+
+
+def sticky_key(user_id):
+    return f'db:sticky:{user_id}'
+
+
+def mark_sticky(user_id):
+    """Read from the primary for a while after the user wrote something."""
+    cache.set(
+        sticky_key(user_id), True, settings.DATABASE_REPLICA_STICKY_SECONDS
+    )
+
+
+def is_sticky(user_id):
+    return cache.get(sticky_key(user_id), False)
+
+
+class ReplicaRouter:
+    """Send reads inside `use_replica()` to the replica, the rest to the
+    primary. Both aliases hold the same data, so relations are allowed
+    and migrations only run on the primary."""
+
+    def db_for_read(self, model, **hints):
+        return REPLICA if replica_reads.get() else 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+class ReplicaStickinessMiddleware:
+    """Mark users sticky to the primary after their successful writes.
+
+    With several processes the Django cache must be shared for the mark
+    to be seen by the next request.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        user = getattr(request, 'user', None)
+        if (has_replica() and request.method not in ('GET', 'HEAD', 'OPTIONS')
+                and response.status_code < 400
+                and user is not None and user.is_authenticated):
+            mark_sticky(user.pk)
+        return response
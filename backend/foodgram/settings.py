@@ -20,6 +20,7 @@ DJANGO_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 ]
 
 THIRD_PARTY_APPS = [
@@ -38,6 +39,8 @@ LOCAL_APPS = [
 INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS + LOCAL_APPS
 
 MIDDLEWARE = [
+    'api.instrumentation.InstrumentationMiddleware',
+    'foodgram.db_router.ReplicaStickinessMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -69,6 +72,10 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'foodgram.wsgi.application'
 
+# Behind pgbouncer in transaction pooling mode server-side cursors
+# (QuerySet.iterator()) can not be used.
+DATABASE_PGBOUNCER = os.getenv('DATABASE_PGBOUNCER', default='False') == 'True'
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
@@ -77,9 +84,60 @@ DATABASES = {
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', default='postgres'),
         'HOST': os.getenv('HOST', default='127.0.0.1'),
         'PORT': os.getenv('PORT', default='5432'),
+        'CONN_MAX_AGE': int(os.getenv('CONN_MAX_AGE', default=60)),
+        'CONN_HEALTH_CHECKS': True,
+        'DISABLE_SERVER_SIDE_CURSORS': DATABASE_PGBOUNCER,
+    }
+}
+
+if os.getenv('REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.getenv('REPLICA_DB', default=DATABASES['default']['NAME']),
+        'HOST': os.getenv('REPLICA_HOST'),
+        'PORT': os.getenv('REPLICA_PORT', default=DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['foodgram.db_router.ReplicaRouter']
+
+# Seconds a user reads from the primary after a write of their own.
+DATABASE_REPLICA_STICKY_SECONDS = int(
+    os.getenv('DATABASE_REPLICA_STICKY_SECONDS', default=5)
+)
+
+# Process-local by default. With several processes (gunicorn workers,
+# job workers, management commands) it must be shared, docker-compose
+# points it at its Redis service; `check --deploy` warns otherwise.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default=''),
     }
 }
 
+CATALOG_CACHE_TIMEOUT = 24 * 60 * 60
+
+CATALOG_CACHE_LOCAL_SIZE = 1024
+
+CATALOG_CACHE_VERSION_TTL = 1
+
+# Ingredient searches without `limit` add substring matches up to
+# this many results.
+INGREDIENT_SEARCH_LIMIT = 50
+
+AUTH_TOKEN_CACHE_SIZE = 10000
+
+# Seconds a process may keep authenticating a token from its local copy
+# after the token or its user changed in another process.
+AUTH_TOKEN_CACHE_TTL = int(os.getenv('AUTH_TOKEN_CACHE_TTL', default=5))
+
+# Seconds a snapshot is kept in the shared cache.
+AUTH_TOKEN_CACHE_TIMEOUT = 10 * 60
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -115,6 +173,77 @@ MEDIA_URL = '/media/'
 
 MEDIA_ROOT = BASE_DIR.joinpath('media')
 
+DEFAULT_FILE_STORAGE = 'foodgram.storage.ContentAddressedStorage'
+
+MEDIA_GARBAGE_MIN_AGE = 60 * 60
+
+# Claims of a background job left running by a crashed worker (or past
+# its timeout) before it is marked failed.
+BACKGROUND_JOB_MAX_ATTEMPTS = 3
+
+SHOPPING_CART_EXPORTERS = [
+    'api.exports.PDFCartExporter',
+    'api.exports.TextCartExporter',
+    'api.exports.CSVCartExporter',
+]
+
+SHOPPING_CART_DEFAULT_FORMAT = 'pdf'
+
+SHOPPING_CART_PDF_FONT = os.getenv(
+    'SHOPPING_CART_PDF_FONT',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+SHOPPING_CART_CACHE_TIMEOUT = 60 * 60
+
+SHOPPING_CART_EXPORT_WORKERS = int(
+    os.getenv('SHOPPING_CART_EXPORT_WORKERS', default=2)
+)
+
+SHOPPING_CART_EXPORT_TIMEOUT = 10 * 60
+
+# Seconds a finished export can be downloaded, collect_media_garbage
+# deletes older ones with their files.
+SHOPPING_CART_EXPORT_MAX_AGE = int(
+    os.getenv('SHOPPING_CART_EXPORT_MAX_AGE', default=24 * 60 * 60)
+)
+
+RECIPE_IMAGE_WORKERS = int(os.getenv('RECIPE_IMAGE_WORKERS', default=2))
+
+RECIPE_IMAGE_JOB_TIMEOUT = 5 * 60
+
+RECIPE_IMAGE_MAX_PIXELS = 40_000_000
+
+RECIPE_IMAGE_RENDITIONS = {
+    'image_small': 320,
+    'image_medium': 800,
+}
+
+RECIPE_IMAGE_FORMAT = 'WEBP'
+
+RECIPE_IMAGE_QUALITY = 80
+
+RECIPE_IMAGE_ORIGINAL_OPTIONS = {'quality': 90}
+
+RECIPE_IMAGE_UPLOAD_MAX_SIZE = int(
+    os.getenv('RECIPE_IMAGE_UPLOAD_MAX_SIZE', default=10 * 2 ** 20)
+)
+
+RECIPE_IMAGE_UPLOAD_CHUNK_SIZE = 64 * 2 ** 10
+
+# Unused uploads are collected as garbage after MEDIA_GARBAGE_MIN_AGE, so
+# their tokens must not outlive it.
+RECIPE_IMAGE_UPLOAD_TOKEN_MAX_AGE = MEDIA_GARBAGE_MIN_AGE
+
+INSTRUMENTATION_BUFFER_SIZE = 10000
+
+INSTRUMENTATION_SLOW_REQUEST = float(
+    os.getenv('INSTRUMENTATION_SLOW_REQUEST', default=0.5)
+)
+
+# The metrics endpoint is disabled without a token.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -133,13 +262,25 @@ LOGGING = {
         'recipes.management.commands.add_ingredients': {
             'level': 'INFO',
             'handlers': ('console', )
-        }
+        },
+        'api.export_jobs': {
+            'level': 'INFO',
+            'handlers': ('console', )
+        },
+        'api.image_jobs': {
+            'level': 'INFO',
+            'handlers': ('console', )
+        },
+        'api.instrumentation': {
+            'level': 'WARNING',
+            'handlers': ('console', )
+        },
     }
 }
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ),
 
     'DEFAULT_PERMISSION_CLASSES': (
@@ -153,6 +294,38 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 6,
 }
 
+RECIPE_IMPORT_BATCH_SIZE = 500
+
+RECIPE_IMPORT_WORKERS = int(os.getenv('RECIPE_IMPORT_WORKERS', default=1))
+
+RECIPE_IMPORT_TIMEOUT = 10 * 60
+
+RECIPE_EXPORT_CHUNK_SIZE = 1000
+
+# Seconds anonymous recipe responses may be cached (nginx micro-cache).
+RECIPE_CACHE_MAX_AGE = int(os.getenv('RECIPE_CACHE_MAX_AGE', default=5))
+
+PAGINATION_COUNT_MODE = os.getenv('PAGINATION_COUNT_MODE', default='exact')
+
+PAGINATION_EXACT_COUNT_THRESHOLD = 10000
+
+# Recipes kept in the feed timeline of a user (trim_feeds).
+FEED_TIMELINE_LENGTH = int(os.getenv('FEED_TIMELINE_LENGTH', default=500))
+
+# Recipes of authors with more followers are not copied to the
+# followers' timelines, the feed merges them in when it is read.
+FEED_FANOUT_MAX_FOLLOWERS = int(
+    os.getenv('FEED_FANOUT_MAX_FOLLOWERS', default=5000)
+)
+
+# Similar recipes stored per recipe by build_similar_recipes.
+SIMILAR_RECIPES_TOP_K = int(os.getenv('SIMILAR_RECIPES_TOP_K', default=20))
+
+# Users with more favorites and cart recipes are left out of similarity.
+SIMILAR_RECIPES_MAX_USER_RECIPES = int(
+    os.getenv('SIMILAR_RECIPES_MAX_USER_RECIPES', default=1000)
+)
+
 DJOSER = {
     'SERIALIZERS': {
         'user_create': 'api.serializers.CustomUserCreateSerializer',
@@ -0,0 +1,106 @@
+import hashlib
+import os
+import posixpath
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import models, transaction
+from django.utils import timezone
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Store files under the SHA-256 of their content.
+
+    `img/photo.jpg` is saved as `img/<2 hex>/<sha256>.jpg`, so identical
+    uploads share one file. A file is deleted by `release_files` when
+    its last reference goes away, unless it was written during the grace
+    period (it may belong to a pending upload or an uncommitted
+    transaction): `collect_media_garbage` removes those later.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+
+        directory, filename = posixpath.split(name.replace('\\', '/'))
+        extension = posixpath.splitext(filename)[1].lower()
+        name = posixpath.join(directory, digest[:2], digest + extension)
+        if self.exists(name):
+            # A fresh modification time keeps collect_media_garbage from
+            # deleting a file that is about to be referenced again.
+            os.utime(self.path(name))
+            return name
+        return super().save(name, content, max_length)
+
+
+def get_file_fields():
+    """Return {model: [file field attnames]} for every installed model."""
+    fields = {}
+    for model in apps.get_models():
+        for field in model._meta.concrete_fields:
+            if isinstance(field, models.FileField):
+                fields.setdefault(model, []).append(field.attname)
+    return fields
+
+
+def delete_expired():
+    """Delete the rows returned by the `expired()` class method of models
+    with files, return their number."""
+    deleted = 0
+    for model in get_file_fields():
+        if hasattr(model, 'expired'):
+            deleted += model.expired().delete()[1].get(
+                model._meta.label, 0
+            )
+    return deleted
+
+
+def get_referenced(names=None):
+    """Return the file names referenced by any model (among `names`)."""
+    referenced = set()
+    for model, fields in get_file_fields().items():
+        queryset = model._default_manager.values_list(*fields)
+        if names is not None:
+            queryset = queryset.filter(reduce(or_, (
+                models.Q(**{f'{field}__in': names}) for field in fields
+            )))
+        for row in queryset.iterator():
+            referenced.update(row)
+    return referenced - {''}
+
+
+def delete_unreferenced(names):
+    """Delete the files of `names` that no model references and that were
+    not written during the last MEDIA_GARBAGE_MIN_AGE seconds."""
+    cutoff = timezone.now() - timedelta(
+        seconds=settings.MEDIA_GARBAGE_MIN_AGE
+    )
+    deleted = []
+    for name in set(names) - get_referenced(names):
+        try:
+            if default_storage.get_modified_time(name) < cutoff:
+                default_storage.delete(name)
+                deleted.append(name)
+        except FileNotFoundError:
+            pass
+    return deleted
+
+
+def release_files(names):
+    """Delete the files of `names` once the current transaction commits,
+    if that was their last reference."""
+    names = {name for name in names if name}
+    if names:
+        transaction.on_commit(lambda: delete_unreferenced(names))
@@ -1,5 +1,6 @@
 from django.contrib import admin
 
+from recipes import shopping_list
 from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
                             ShoppingCart, Subscription, Tag)
 
@@ -26,16 +27,31 @@ class RecipeIngredientAdminInline(admin.TabularInline):
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
-    readonly_fields = ('favorites', )
-    list_display = ('name', 'author', )
+    readonly_fields = ('favorites_count', 'image_small', 'image_medium', )
+    list_display = ('name', 'author', 'favorites_count', )
     list_filter = ('author', 'tags', )
     search_fields = ('name', )
     search_help_text = 'NAME'
     list_per_page = 50
     inlines = [RecipeIngredientAdminInline, ]
 
-    def favorites(self, obj):
-        return obj.favorites.count()
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return queryset.search(search_term), False
+
+    def save_model(self, request, obj, form, change):
+        if change and 'image' in form.changed_data:
+            obj.clear_renditions()
+        super().save_model(request, obj, form, change)
+
+    def save_related(self, request, form, formsets, change):
+        recipe_id = form.instance.pk
+        old_amounts = shopping_list.get_recipe_amounts(recipe_id)
+        super().save_related(request, form, formsets, change)
+        shopping_list.change_recipe(
+            recipe_id, old_amounts, shopping_list.get_recipe_amounts(recipe_id)
+        )
 
 
 @admin.register(ShoppingCart)
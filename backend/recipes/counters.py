@@ -0,0 +1,34 @@
+from django.apps import apps
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+# (counter model, counter field, counted model, foreign key to the counter)
+COUNTERS = (
+    ('recipes.Recipe', 'favorites_count', 'recipes.Favorite', 'recipe'),
+    ('users.User', 'recipes_count', 'recipes.Recipe', 'author'),
+    ('users.User', 'followers_count', 'recipes.Subscription', 'author'),
+)
+
+
+def recount_counters():
+    """Set the counter columns from the rows they count.
+
+    Only rows that drifted are written. Returns the number of repaired
+    rows per counter.
+    """
+    repaired = {}
+    for model_name, counter, counted_name, field in COUNTERS:
+        model = apps.get_model(model_name)
+        counted = apps.get_model(counted_name)
+        actual = Coalesce(Subquery(
+            counted.objects.filter(**{field: OuterRef('pk')})
+            .order_by().values(field)
+            .annotate(total=Count('pk')).values('total')
+        ), 0)
+        drifted = model.objects.alias(actual=actual).exclude(
+            **{counter: F('actual')}
+        ).values('pk')
+        repaired[f'{model_name}.{counter}'] = model.objects.filter(
+            pk__in=drifted
+        ).update(**{counter: actual})
+    return repaired
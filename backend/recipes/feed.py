@@ -0,0 +1,170 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, connections, router, transaction
+
+from recipes.models import FeedEntry, Recipe, Subscription
+
+User = get_user_model()
+
+COLUMNS = 'user_id, recipe_id, author_id, pub_date'
+
+
+def fan_out(recipe_ids):
+    """Add recipes to the timelines of the followers of their authors.
+
+    Authors with more than FEED_FANOUT_MAX_FOLLOWERS followers are
+    skipped, their recipes are merged in by `read_timeline`. The
+    timelines that got new entries are trimmed back to
+    FEED_TIMELINE_LENGTH.
+    """
+    feed = FeedEntry._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {feed} ({COLUMNS}) '
+            f'SELECT sub.user_id, recipe.id, recipe.author_id, '
+            f'recipe.pub_date '
+            f'FROM {Recipe._meta.db_table} recipe '
+            f'JOIN {User._meta.db_table} author '
+            f'ON author.id = recipe.author_id '
+            f'JOIN {Subscription._meta.db_table} sub '
+            f'ON sub.author_id = recipe.author_id '
+            f'WHERE recipe.id = ANY(%s) AND author.followers_count <= %s '
+            f'ON CONFLICT (user_id, recipe_id) DO NOTHING '
+            f'RETURNING user_id',
+            (list(recipe_ids), settings.FEED_FANOUT_MAX_FOLLOWERS)
+        )
+        user_ids = {user_id for user_id, in cursor.fetchall()}
+    if user_ids:
+        trim_timelines(user_ids)
+
+
+def read_timeline(user_id, limit, before=None):
+    """Return `(recipe_id, pub_date)` of the next `limit` recipes of a
+    timeline, newest first, after the `(pub_date, recipe_id)` position
+    `before`.
+
+    The stored entries are merged with the latest recipes of the followed
+    authors above FEED_FANOUT_MAX_FOLLOWERS, which are never copied: each
+    side is a bounded index scan. Reads only, on the replica if any.
+    """
+    feed = FeedEntry._meta.db_table
+    recipes = Recipe._meta.db_table
+    entries_after = recipes_after = ''
+    position = ()
+    if before is not None:
+        entries_after = 'AND (pub_date, recipe_id) < (%s, %s) '
+        recipes_after = 'AND (recipe.pub_date, recipe.id) < (%s, %s) '
+        position = tuple(before)
+    with connections[router.db_for_read(FeedEntry)].cursor() as cursor:
+        cursor.execute(
+            f'SELECT recipe_id, pub_date FROM ('
+            f'(SELECT recipe_id, pub_date FROM {feed} '
+            f'WHERE user_id = %s {entries_after}'
+            f'ORDER BY pub_date DESC, recipe_id DESC LIMIT %s) '
+            f'UNION '
+            f'(SELECT recipe.id, recipe.pub_date '
+            f'FROM {Subscription._meta.db_table} sub '
+            f'JOIN {User._meta.db_table} author '
+            f'ON author.id = sub.author_id '
+            f'CROSS JOIN LATERAL ('
+            f'SELECT id, pub_date FROM {recipes} recipe '
+            f'WHERE recipe.author_id = sub.author_id {recipes_after}'
+            f'ORDER BY recipe.pub_date DESC, recipe.id DESC LIMIT %s'
+            f') recipe '
+            f'WHERE sub.user_id = %s AND author.followers_count > %s)'
+            f') timeline ORDER BY pub_date DESC, recipe_id DESC LIMIT %s',
+            (
+                user_id, *position, limit, *position, limit,
+                user_id, settings.FEED_FANOUT_MAX_FOLLOWERS, limit
+            )
+        )
+        return cursor.fetchall()
+
+
+def follow(user_id, author_id):
+    """Backfill a timeline with the latest recipes of a new author and
+    trim it back to FEED_TIMELINE_LENGTH.
+
+    Recipes of popular authors are left to `read_timeline`.
+    """
+    feed = FeedEntry._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {feed} ({COLUMNS}) '
+            f'SELECT %s, recipe.id, recipe.author_id, recipe.pub_date '
+            f'FROM {Recipe._meta.db_table} recipe '
+            f'JOIN {User._meta.db_table} author '
+            f'ON author.id = recipe.author_id '
+            f'WHERE recipe.author_id = %s AND author.followers_count <= %s '
+            f'ORDER BY recipe.pub_date DESC LIMIT %s '
+            f'ON CONFLICT (user_id, recipe_id) DO NOTHING',
+            (
+                user_id, author_id, settings.FEED_FANOUT_MAX_FOLLOWERS,
+                settings.FEED_TIMELINE_LENGTH
+            )
+        )
+    trim_timelines([user_id])
+
+
+def unfollow(user_id, author_id):
+    FeedEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def trim_timelines(user_ids=None):
+    """Keep the FEED_TIMELINE_LENGTH latest entries of the timelines of
+    `user_ids` (of every timeline by default), return the number of
+    deleted entries."""
+    feed = FeedEntry._meta.db_table
+    with connection.cursor() as cursor:
+        if user_ids is not None:
+            # Walks the timeline index past the kept entries of each user.
+            cursor.execute(
+                f'DELETE FROM {feed} WHERE id IN ('
+                f'SELECT old.id FROM UNNEST(%s) AS timeline(user_id) '
+                f'CROSS JOIN LATERAL ('
+                f'SELECT id FROM {feed} WHERE user_id = timeline.user_id '
+                f'ORDER BY pub_date DESC, id DESC OFFSET %s'
+                f') old)',
+                (list(user_ids), settings.FEED_TIMELINE_LENGTH)
+            )
+            return cursor.rowcount
+        cursor.execute(
+            f'DELETE FROM {feed} WHERE id IN ('
+            f'SELECT id FROM ('
+            f'SELECT id, ROW_NUMBER() OVER ('
+            f'PARTITION BY user_id ORDER BY pub_date DESC, id DESC'
+            f') AS position FROM {feed}'
+            f') ranked WHERE ranked.position > %s)',
+            (settings.FEED_TIMELINE_LENGTH, )
+        )
+        return cursor.rowcount
+
+
+def rebuild_timelines():
+    """Refill every timeline with the latest recipes of the followed
+    authors that are not merged in on read, return the number of
+    entries."""
+    feed = FeedEntry._meta.db_table
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {feed}')
+        cursor.execute(
+            f'INSERT INTO {feed} ({COLUMNS}) '
+            f'SELECT {COLUMNS} FROM ('
+            f'SELECT sub.user_id, recipe.id AS recipe_id, recipe.author_id, '
+            f'recipe.pub_date, ROW_NUMBER() OVER ('
+            f'PARTITION BY sub.user_id ORDER BY recipe.pub_date DESC, '
+            f'recipe.id DESC'
+            f') AS position '
+            f'FROM {Subscription._meta.db_table} sub '
+            f'JOIN {User._meta.db_table} author '
+            f'ON author.id = sub.author_id '
+            f'JOIN {Recipe._meta.db_table} recipe '
+            f'ON recipe.author_id = sub.author_id '
+            f'WHERE author.followers_count <= %s'
+            f') ranked WHERE position <= %s',
+            (
+                settings.FEED_FANOUT_MAX_FOLLOWERS,
+                settings.FEED_TIMELINE_LENGTH
+            )
+        )
+        return cursor.rowcount
@@ -1,35 +1,144 @@
 import csv
+import json
 import logging
+import time
+from itertools import islice
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
 from foodgram.settings import BASE_DIR
 from recipes.models import Ingredient
+from recipes.signals import catalog_changed
 
 logger = logging.getLogger(__name__)
 
 DATA_PATH = BASE_DIR.joinpath('fixtures')
 
-DATA_FILES = {
-    'ingredients.csv': (Ingredient, ['name', 'measurement_unit']),
+DEFAULT_FILE = DATA_PATH.joinpath('ingredients.csv')
+
+FIELDS = ('name', 'measurement_unit')
+
+
+def iter_csv(file):
+    for row in csv.reader(file):
+        yield dict(zip(FIELDS, row))
+
+
+def iter_json(file, chunk_size=1 << 16):
+    """Yield the items of a top-level JSON array without loading it whole."""
+    decoder = json.JSONDecoder()
+    buffer, started, eof = '', False, False
+    while True:
+        buffer = buffer.lstrip(' \t\r\n,' if started else ' \t\r\n')
+        if buffer:
+            if not started:
+                if buffer[0] != '[':
+                    raise ValueError('Expected a JSON array.')
+                buffer, started = buffer[1:], True
+                continue
+            if buffer[0] == ']':
+                return
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                yield item
+                buffer = buffer[end:]
+                continue
+        elif eof:
+            raise ValueError('Unexpected end of the JSON array.')
+
+        chunk = file.read(chunk_size)
+        eof = not chunk
+        buffer += chunk
+
+
+READERS = {
+    'csv': iter_csv,
+    'json': iter_json,
 }
 
 
+def clean(row):
+    """Return the (name, measurement_unit) key of a row, None if invalid."""
+    if not isinstance(row, dict):
+        return None
+    key = tuple(str(row.get(field) or '').strip() for field in FIELDS)
+    max_length = Ingredient._meta.get_field('name').max_length
+    if not all(key) or any(len(value) > max_length for value in key):
+        return None
+    return key
+
+
 class Command(BaseCommand):
     help = 'Adding ingredients in database.'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default=str(DEFAULT_FILE),
+            help='CSV (name,measurement_unit rows) or JSON array file.'
+        )
+        parser.add_argument('--format', choices=READERS)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
     def handle(self, *args, **options):
-        for file_name in DATA_FILES:
-            file = DATA_PATH.joinpath(file_name)
-            model, fieldnames = DATA_FILES[file_name]
-
-            if file.exists():
-                with open(file, mode='r') as file:
-                    reader = csv.DictReader(file, fieldnames=fieldnames)
-                    data = [model(**row) for row in reader]
-                    try:
-                        logger.info(model.objects.bulk_create(data))
-                    except Exception as err:
-                        logger.error(err, exc_info=True)
+        path = options['path']
+        file_format = options['format'] or path.rsplit('.', 1)[-1].lower()
+        if file_format not in READERS:
+            raise CommandError(
+                f'Unknown format "{file_format}", use --format.'
+            )
+
+        try:
+            file = open(path, mode='r', encoding='utf-8')
+        except OSError as err:
+            raise CommandError(f'Can not read "{path}": {err}')
+
+        counts = {'inserted': 0, 'skipped': 0, 'invalid': 0}
+        started = time.perf_counter()
+        with file:
+            rows = READERS[file_format](file)
+            while batch := list(islice(rows, options['batch_size'])):
+                self.load_batch(batch, counts)
+                logger.info(
+                    '%d rows read: %d inserted, %d skipped, %d invalid',
+                    sum(counts.values()), *counts.values()
+                )
+
+        elapsed = time.perf_counter() - started
+        logger.info(
+            'Done in %.1f s, %.0f rows/s: %d inserted, %d skipped, '
+            '%d invalid', elapsed, sum(counts.values()) / (elapsed or 1),
+            *counts.values()
+        )
+        if counts['inserted']:
+            catalog_changed.send(sender=Ingredient)
+
+    @staticmethod
+    def load_batch(batch, counts):
+        """Insert the new ingredients of a batch, skip known ones."""
+        keys = []
+        for row in batch:
+            key = clean(row)
+            if key is None:
+                counts['invalid'] += 1
             else:
-                logger.error(f'File "{file_name}" does not exist at: {file}')
+                keys.append(key)
+
+        unique = set(keys)
+        existing = set(Ingredient.objects.filter(
+            name__in={name for name, _ in unique}
+        ).values_list('name', 'measurement_unit'))
+        new = unique - existing
+
+        # ON CONFLICT DO NOTHING keeps concurrent loaders from failing on
+        # ingredients inserted after the lookup above.
+        Ingredient.objects.bulk_create(
+            [Ingredient(name=name, measurement_unit=unit)
+             for name, unit in new],
+            ignore_conflicts=True
+        )
+        counts['inserted'] += len(new)
+        counts['skipped'] += len(keys) - len(new)
@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipes.similarity import build_similar, refresh_similar
+
+
+class Command(BaseCommand):
+    help = (
+        'Building the top-K similar recipes of every recipe from the '
+        'favorites and shopping carts of the same users.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--incremental', action='store_true',
+            help='Only refresh the recipes affected by favorites and carts '
+                 'changed since the last run.'
+        )
+        parser.add_argument(
+            '--top-k', type=int, default=settings.SIMILAR_RECIPES_TOP_K,
+            help='Similar recipes stored per recipe.'
+        )
+
+    def handle(self, *args, **options):
+        build = refresh_similar if options['incremental'] else build_similar
+        recipes, rows = build(options['top_k'])
+        self.stdout.write(
+            f'Similar recipes: {rows} rows for {recipes} recipes built.'
+        )
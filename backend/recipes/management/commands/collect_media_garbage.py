@@ -0,0 +1,74 @@
+import posixpath
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from foodgram.storage import delete_expired, get_file_fields, get_referenced
+
+
+def get_media_roots():
+    """Top directories of the upload_to paths of every file field."""
+    roots = set()
+    for model, fields in get_file_fields().items():
+        for attname in fields:
+            upload_to = model._meta.get_field(attname).upload_to
+            if isinstance(upload_to, str) and upload_to.strip('/'):
+                roots.add(upload_to.strip('/').split('/')[0])
+    return sorted(roots)
+
+
+def walk(storage, path):
+    directories, files = storage.listdir(path)
+    for name in files:
+        yield posixpath.join(path, name)
+    for directory in directories:
+        yield from walk(storage, posixpath.join(path, directory))
+
+
+class Command(BaseCommand):
+    help = (
+        'Deleting expired exports and media files no longer referenced by '
+        'any model.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age', type=int, default=settings.MEDIA_GARBAGE_MIN_AGE,
+            help='Keep files modified less than this many seconds ago, '
+                 'they may belong to a transaction still in progress.'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only list the files that would be deleted.'
+        )
+
+    def handle(self, *args, **options):
+        storage = default_storage
+        cutoff = timezone.now() - timedelta(seconds=options['min_age'])
+        if not options['dry_run']:
+            self.stdout.write(f'Expired rows deleted: {delete_expired()}.')
+        referenced = get_referenced()
+
+        deleted, size = 0, 0
+        for root in get_media_roots():
+            if not storage.exists(root):
+                continue
+            for name in walk(storage, root):
+                if (name in referenced
+                        or storage.get_modified_time(name) > cutoff):
+                    continue
+                size += storage.size(name)
+                deleted += 1
+                if options['dry_run']:
+                    self.stdout.write(name)
+                else:
+                    storage.delete(name)
+
+        self.stdout.write(
+            f'Orphaned files: {deleted} '
+            f'{"found" if options["dry_run"] else "deleted"}, '
+            f'{size / 2 ** 20:.1f} MiB.'
+        )
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from recipes.counters import recount_counters
+from recipes.feed import rebuild_timelines
+from recipes.shopping_list import rebuild_shopping_lists
+
+
+class Command(BaseCommand):
+    help = 'Repairing drifted counters, rebuilding shopping lists and feeds.'
+
+    def handle(self, *args, **options):
+        for counter, repaired in recount_counters().items():
+            self.stdout.write(f'{counter}: {repaired} rows repaired.')
+        self.stdout.write(
+            f'Shopping lists: {rebuild_shopping_lists()} items rebuilt.'
+        )
+        self.stdout.write(f'Feeds: {rebuild_timelines()} entries rebuilt.')
@@ -0,0 +1,207 @@
+import random
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from recipes.counters import recount_counters
+from recipes.feed import rebuild_timelines
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Subscription, Tag)
+from recipes.shopping_list import rebuild_shopping_lists
+from recipes.signals import catalog_changed
+from recipes.similarity import build_similar
+
+User = get_user_model()
+
+BENCHMARK_PASSWORD = 'benchmark'
+BENCHMARK_IMAGE = 'img/benchmark.jpg'
+
+
+class ZipfChooser:
+    """Pick items with Zipf-like skew: a few hot items, a long tail."""
+
+    def __init__(self, rng, items, exponent):
+        self.rng = rng
+        self.items = list(items)
+        rng.shuffle(self.items)
+        self.cum_weights = list(accumulate(
+            1 / (rank ** exponent) for rank in range(1, len(self.items) + 1)
+        ))
+
+    def choose(self, k):
+        return self.rng.choices(self.items, cum_weights=self.cum_weights, k=k)
+
+
+class Command(BaseCommand):
+    help = 'Generating skewed synthetic data for load benchmarks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--tags', type=int, default=10)
+        parser.add_argument(
+            '--ingredients-per-recipe', type=int, default=8,
+            help='Average number of ingredients in a recipe.'
+        )
+        parser.add_argument('--favorites', type=int, default=50000)
+        parser.add_argument('--carts', type=int, default=5000)
+        parser.add_argument('--subscriptions', type=int, default=10000)
+        parser.add_argument(
+            '--skew', type=float, default=1.1,
+            help='Zipf exponent for authors, recipes and ingredients.'
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.skew = options['skew']
+        self.batch_size = options['batch_size']
+
+        ingredients = list(Ingredient.objects.values_list('id', 'name'))
+        if not ingredients:
+            raise CommandError(
+                'There are no ingredients, run add_ingredients first.'
+            )
+
+        tags = self.seed_tags(options['tags'])
+        users = self.seed_users(options['users'])
+        recipes = self.seed_recipes(
+            options['recipes'], users, tags, ingredients,
+            options['ingredients_per_recipe']
+        )
+
+        user_chooser = ZipfChooser(self.rng, users, self.skew)
+        recipe_chooser = ZipfChooser(self.rng, recipes, self.skew)
+        author_chooser = ZipfChooser(self.rng, users, self.skew)
+        self.seed_pairs(
+            Favorite, 'recipe_id', options['favorites'],
+            user_chooser, recipe_chooser
+        )
+        self.seed_pairs(
+            ShoppingCart, 'recipe_id', options['carts'],
+            user_chooser, recipe_chooser
+        )
+        self.seed_pairs(
+            Subscription, 'author_id', options['subscriptions'],
+            user_chooser, author_chooser
+        )
+        # bulk_create sends no signals, so the aggregates are set in bulk.
+        recount_counters()
+        rebuild_shopping_lists()
+        rebuild_timelines()
+        build_similar()
+
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+    def bulk_create(self, model, objects, ignore_conflicts=False):
+        created = []
+        for start in range(0, len(objects), self.batch_size):
+            created += model.objects.bulk_create(
+                objects[start:start + self.batch_size],
+                ignore_conflicts=ignore_conflicts
+            )
+        return created
+
+    def seed_tags(self, count):
+        existing = list(Tag.objects.values_list('id', flat=True))
+        start = Tag.objects.filter(slug__startswith='bench-').count()
+        missing = [
+            Tag(
+                name=f'Benchmark {number}', slug=f'bench-{number}',
+                color=f'#{self.rng.randrange(0x1000000):06X}-{number}'
+            )
+            for number in range(start, start + max(count - len(existing), 0))
+        ]
+        if missing:
+            self.bulk_create(Tag, missing)
+            catalog_changed.send(sender=Tag)
+        self.stdout.write(f'Tags: {len(missing)} created.')
+        return list(Tag.objects.values_list('id', flat=True))
+
+    def seed_users(self, count):
+        start = User.objects.filter(username__startswith='bench').count()
+        password = make_password(BENCHMARK_PASSWORD)
+        users = [
+            User(
+                username=f'bench{number}', email=f'bench{number}@example.com',
+                first_name='Bench', last_name=f'User {number}',
+                password=password
+            )
+            for number in range(start, start + count)
+        ]
+        users = self.bulk_create(User, users)
+        self.stdout.write(f'Users: {len(users)} created.')
+        return [user.pk for user in users]
+
+    def seed_recipes(self, count, users, tags, ingredients, per_recipe):
+        authors = ZipfChooser(self.rng, users, self.skew).choose(count)
+        ingredient_chooser = ZipfChooser(self.rng, ingredients, self.skew)
+        now = timezone.now()
+
+        recipes = []
+        recipe_ingredients = []
+        for author in authors:
+            size = self.rng.randint(1, max(2 * per_recipe - 1, 1))
+            chosen = dict(ingredient_chooser.choose(size))
+            names = list(chosen.values())
+            recipes.append(Recipe(
+                author_id=author,
+                name=' '.join(names[:3])[:200],
+                text=f'Приготовить из: {", ".join(names)}.',
+                image=BENCHMARK_IMAGE,
+                cooking_time=self.rng.randint(5, 180),
+            ))
+            recipe_ingredients.append(chosen)
+
+        recipes = self.bulk_create(Recipe, recipes)
+        # pub_date is auto_now_add, spread it over the last year afterwards.
+        for recipe in recipes:
+            recipe.pub_date = now - timedelta(
+                seconds=self.rng.randrange(365 * 24 * 3600)
+            )
+        Recipe.objects.bulk_update(
+            recipes, ['pub_date'], batch_size=self.batch_size
+        )
+
+        self.bulk_create(RecipeIngredient, [
+            RecipeIngredient(
+                recipe_id=recipe.pk, ingredient_id=ingredient,
+                amount=self.rng.randint(1, 500)
+            )
+            for recipe, chosen in zip(recipes, recipe_ingredients)
+            for ingredient in chosen
+        ])
+        self.bulk_create(Recipe.tags.through, [
+            Recipe.tags.through(recipe_id=recipe.pk, tag_id=tag)
+            for recipe in recipes
+            for tag in self.rng.sample(tags, min(len(tags), 3))
+        ])
+        catalog_changed.send(sender=Recipe)
+        self.stdout.write(f'Recipes: {len(recipes)} created.')
+        return [recipe.pk for recipe in recipes]
+
+    def seed_pairs(self, model, target, count, user_chooser, target_chooser):
+        before = model.objects.count()
+        pairs = {
+            (user, other)
+            for user, other in zip(
+                user_chooser.choose(count), target_chooser.choose(count)
+            )
+            if user != other or target != 'author_id'
+        }
+        self.bulk_create(model, [
+            model(user_id=user, **{target: other}) for user, other in pairs
+        ], ignore_conflicts=True)
+        created = model.objects.count() - before
+        self.stdout.write(
+            f'{model._meta.verbose_name_plural.capitalize()}: '
+            f'{created} created.'
+        )
@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipes.feed import trim_timelines
+
+
+class Command(BaseCommand):
+    help = (
+        'Deleting feed entries beyond FEED_TIMELINE_LENGTH of every '
+        'timeline.'
+    )
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f'Feed entries deleted: {trim_timelines()}, '
+            f'{settings.FEED_TIMELINE_LENGTH} kept per timeline.'
+        )
@@ -0,0 +1,42 @@
+# Generated by Django 4.1.4 on 2026-10-18 01:37
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+# (counter model, counter field, counted model, foreign key to the counter)
+COUNTERS = (
+    ('recipes.Recipe', 'favorites_count', 'recipes.Favorite', 'recipe'),
+    ('users.User', 'recipes_count', 'recipes.Recipe', 'author'),
+    ('users.User', 'followers_count', 'recipes.Subscription', 'author'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    db = schema_editor.connection.alias
+    for model_name, counter, counted_name, field in COUNTERS:
+        counted = apps.get_model(counted_name)
+        apps.get_model(model_name).objects.using(db).update(**{
+            counter: Coalesce(Subquery(
+                counted.objects.using(db).filter(**{field: OuterRef('pk')})
+                .order_by().values(field)
+                .annotate(total=Count('pk')).values('total')
+            ), 0)
+        })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_access_path_indexes'),
+        ('users', '0002_user_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='favorites count'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
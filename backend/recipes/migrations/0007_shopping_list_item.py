@@ -0,0 +1,50 @@
+# Generated by Django 4.1.4 on 2026-10-18 01:39
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_shopping_lists(apps, schema_editor):
+    item = apps.get_model('recipes', 'ShoppingListItem')._meta.db_table
+    cart = apps.get_model('recipes', 'ShoppingCart')._meta.db_table
+    recipe_ingredient = apps.get_model(
+        'recipes', 'RecipeIngredient'
+    )._meta.db_table
+    schema_editor.execute(
+        f'INSERT INTO {item} (user_id, ingredient_id, total_amount) '
+        f'SELECT cart.user_id, ri.ingredient_id, SUM(ri.amount) '
+        f'FROM {cart} cart JOIN {recipe_ingredient} ri '
+        f'ON ri.recipe_id = cart.recipe_id '
+        f'GROUP BY cart.user_id, ri.ingredient_id'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0006_recipe_favorites_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_amount', models.PositiveIntegerField(verbose_name='total amount')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='recipes.ingredient', verbose_name='ingredient')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list', to=settings.AUTH_USER_MODEL, verbose_name='user')),
+            ],
+            options={
+                'verbose_name': 'shopping list item',
+                'verbose_name_plural': 'shopping list items',
+                'ordering': ('pk',),
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglistitem',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), include=('total_amount',), name='shop_list_user_ingredient_unique'),
+        ),
+        migrations.RunPython(fill_shopping_lists, migrations.RunPython.noop),
+    ]
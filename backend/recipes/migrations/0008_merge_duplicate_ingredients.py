@@ -0,0 +1,57 @@
+# Generated by Django 4.1.4 on 2026-10-18 01:43
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+MAX_AMOUNT = 32767
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    """Point recipes and shopping lists at the first of equal ingredients
+    and delete the rest, so the unique constraint can be added."""
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+
+    duplicates = Ingredient.objects.values(
+        'name', 'measurement_unit'
+    ).annotate(keep=Min('pk'), total=Count('pk')).filter(total__gt=1)
+    for group in duplicates:
+        others = list(Ingredient.objects.filter(
+            name=group['name'], measurement_unit=group['measurement_unit']
+        ).exclude(pk=group['keep']).values_list('pk', flat=True))
+
+        for model, owner, amount in (
+            (RecipeIngredient, 'recipe_id', 'amount'),
+            (ShoppingListItem, 'user_id', 'total_amount'),
+        ):
+            for row in model.objects.filter(ingredient_id__in=others):
+                kept = model.objects.filter(
+                    ingredient_id=group['keep'],
+                    **{owner: getattr(row, owner)}
+                ).first()
+                if kept is None:
+                    row.ingredient_id = group['keep']
+                    row.save(update_fields=['ingredient'])
+                    continue
+                total = getattr(kept, amount) + getattr(row, amount)
+                if model is RecipeIngredient:
+                    total = min(total, MAX_AMOUNT)
+                setattr(kept, amount, total)
+                kept.save(update_fields=[amount])
+                row.delete()
+
+        Ingredient.objects.filter(pk__in=others).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_shopping_list_item'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 4.1.4 on 2026-10-18 02:09
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_timelines(apps, schema_editor):
+    feed = apps.get_model('recipes', 'FeedEntry')._meta.db_table
+    recipe = apps.get_model('recipes', 'Recipe')._meta.db_table
+    subscription = apps.get_model('recipes', 'Subscription')._meta.db_table
+    schema_editor.execute(
+        f'INSERT INTO {feed} (user_id, recipe_id, author_id, pub_date) '
+        f'SELECT user_id, recipe_id, author_id, pub_date FROM ('
+        f'SELECT sub.user_id, recipe.id AS recipe_id, recipe.author_id, '
+        f'recipe.pub_date, ROW_NUMBER() OVER ('
+        f'PARTITION BY sub.user_id ORDER BY recipe.pub_date DESC, '
+        f'recipe.id DESC'
+        f') AS position '
+        f'FROM {subscription} sub JOIN {recipe} recipe '
+        f'ON recipe.author_id = sub.author_id'
+        f') ranked WHERE position <= %s',
+        (settings.FEED_TIMELINE_LENGTH, )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0011_recipe_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='publication date')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='author')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='recipes.recipe', verbose_name='recipe')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to=settings.AUTH_USER_MODEL, verbose_name='user')),
+            ],
+            options={
+                'verbose_name': 'feed entry',
+                'verbose_name_plural': 'feed entries',
+                'ordering': ('-pub_date', '-id'),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='feedentry',
+            index=models.Index(fields=['user', '-pub_date', '-id'], name='feed_user_pub_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='feedentry',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='feed_user_recipe_unique'),
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.1.4 on 2026-10-18 02:25
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_similar_recipe'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='updated_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='modification date'),
+        ),
+    ]
@@ -1,8 +1,19 @@
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector,
+                                            TrigramWordSimilarity)
 from django.db import models
+from django.utils import timezone
+
+from users.models import CounterFieldsMixin
 
 User = get_user_model()
 
+SEARCH_CONFIG = 'russian'
+
+RECIPE_SEARCH_VECTOR = SearchVector('name', 'text', config=SEARCH_CONFIG)
+
 
 class Tag(models.Model):
     name = models.CharField(max_length=40, unique=True, verbose_name='name')
@@ -28,24 +39,64 @@ class Ingredient(models.Model):
         verbose_name = 'ingredient'
         verbose_name_plural = 'ingredients'
         ordering = ('pk', )
-        indexes = [
-            models.Index(fields=['name'], name='ingredient_name_idx'),
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='ingredient_name_unit_unique'
+            ),
         ]
 
     def __str__(self):
         return self.name[:40]
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+
+    def search(self, value):
+        """Full-text search over name and text plus fuzzy name matching.
+
+        Every condition is served by a GIN index, results are ordered by
+        relevance.
+        """
+        query = SearchQuery(
+            value, config=SEARCH_CONFIG, search_type='websearch'
+        )
+        return self.alias(
+            search_vector=RECIPE_SEARCH_VECTOR
+        ).filter(
+            models.Q(search_vector=query)
+            | models.Q(name__trigram_word_similar=value)
+        ).annotate(
+            search_rank=(
+                SearchRank(RECIPE_SEARCH_VECTOR, query)
+                + TrigramWordSimilarity(value, 'name')
+            )
+        ).order_by('-search_rank', '-pub_date')
+
+
+class Recipe(CounterFieldsMixin, models.Model):
     pub_date = models.DateTimeField(
         auto_now_add=True, verbose_name='publication date'
     )
+    # Set in save(), not auto_now: a default lets raw fixture loads
+    # without the field fill it.
+    updated_at = models.DateTimeField(
+        default=timezone.now, verbose_name='modification date'
+    )
     author = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name='recipes',
-        verbose_name='author'
+        db_index=False, verbose_name='author'
     )
     name = models.CharField(max_length=200, verbose_name='name')
     image = models.ImageField(upload_to='img/', verbose_name='image')
+    image_small = models.ImageField(
+        upload_to='img/small/', blank=True, editable=False,
+        verbose_name='small image'
+    )
+    image_medium = models.ImageField(
+        upload_to='img/medium/', blank=True, editable=False,
+        verbose_name='medium image'
+    )
     text = models.TextField(verbose_name='description')
     cooking_time = models.PositiveSmallIntegerField(
         verbose_name='cooking time', help_text='integer in minutes'
@@ -54,11 +105,42 @@ class Recipe(models.Model):
         Ingredient, through='RecipeIngredient',
     )
     tags = models.ManyToManyField(Tag, verbose_name='tags')
+    favorites_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='favorites count'
+    )
+
+    objects = RecipeQuerySet.as_manager()
+
+    counter_fields = ('favorites_count', )
+
+    rendition_fields = ('image_small', 'image_medium')
 
     class Meta:
         verbose_name = 'recipe'
         verbose_name_plural = 'recipes'
         ordering = ('-pub_date', )
+        indexes = [
+            GinIndex(
+                fields=['name'], opclasses=['gin_trgm_ops'],
+                name='recipe_name_trgm_idx'
+            ),
+            GinIndex(RECIPE_SEARCH_VECTOR, name='recipe_search_idx'),
+            models.Index(
+                fields=['-pub_date', '-id'], name='recipe_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date'],
+                name='recipe_author_pub_date_idx'
+            ),
+            # A released file is deleted only if no recipe uses it.
+            models.Index(fields=['image'], name='recipe_image_idx'),
+            models.Index(
+                fields=['image_small'], name='recipe_image_small_idx'
+            ),
+            models.Index(
+                fields=['image_medium'], name='recipe_image_medium_idx'
+            ),
+        ]
         constraints = [
             models.CheckConstraint(
                 check=models.Q(cooking_time__gt=0),
@@ -69,11 +151,24 @@ class Recipe(models.Model):
     def __str__(self):
         return self.name[:40]
 
+    def save(self, *args, **kwargs):
+        self.updated_at = timezone.now()
+        super().save(*args, **kwargs)
+
+    def clear_renditions(self):
+        """Drop the resized copies of a replaced image.
+
+        New renditions are rendered by the image workers, the old files
+        are released when the recipe is saved.
+        """
+        for field in self.rendition_fields:
+            setattr(self, field, '')
+
 
 class RecipeIngredient(models.Model):
     recipe = models.ForeignKey(
         Recipe, on_delete=models.CASCADE, related_name='ingredients_set',
-        verbose_name='recipe'
+        db_index=False, verbose_name='recipe'
     )
     ingredient = models.ForeignKey(
         Ingredient, on_delete=models.CASCADE, related_name='recipes_set',
@@ -89,7 +184,7 @@ class RecipeIngredient(models.Model):
         ordering = ('pk', )
         constraints = [
             models.UniqueConstraint(
-                fields=['recipe', 'ingredient'],
+                fields=['recipe', 'ingredient'], include=['amount'],
                 name='rec_ing_recipe_ingredient_unique'
             ),
             models.CheckConstraint(
@@ -106,11 +201,11 @@ class RecipeIngredient(models.Model):
 class ShoppingCart(models.Model):
     user = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name='shopping_cart',
-        verbose_name='user'
+        db_index=False, verbose_name='user'
     )
     recipe = models.ForeignKey(
         Recipe, on_delete=models.CASCADE, related_name='shopping_cart',
-        verbose_name='recipe'
+        db_index=False, verbose_name='recipe'
     )
 
     class Meta:
@@ -122,6 +217,11 @@ class ShoppingCart(models.Model):
                 fields=['user', 'recipe'], name='shop_user_recipe_unique'
             ),
         ]
+        indexes = [
+            models.Index(
+                fields=['recipe', 'user'], name='shop_recipe_user_idx'
+            ),
+        ]
 
     def __str__(self):
         return (
@@ -129,14 +229,45 @@ class ShoppingCart(models.Model):
         )
 
 
+class ShoppingListItem(models.Model):
+    """Ingredient totals of a user's shopping cart, kept up to date with
+    deltas when the cart or the ingredients of a cart recipe change.
+    """
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='shopping_list',
+        db_index=False, verbose_name='user'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient, on_delete=models.CASCADE, related_name='+',
+        verbose_name='ingredient'
+    )
+    total_amount = models.PositiveIntegerField(verbose_name='total amount')
+
+    class Meta:
+        verbose_name = 'shopping list item'
+        verbose_name_plural = 'shopping list items'
+        ordering = ('pk', )
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'], include=['total_amount'],
+                name='shop_list_user_ingredient_unique'
+            ),
+        ]
+
+    def __str__(self):
+        return (
+            f'Ingredient {self.ingredient_id} in {self.user_id} shopping list'
+        )
+
+
 class Favorite(models.Model):
     user = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name='favorites',
-        verbose_name='user'
+        db_index=False, verbose_name='user'
     )
     recipe = models.ForeignKey(
         Recipe, on_delete=models.CASCADE, related_name='favorites',
-        verbose_name='recipe'
+        db_index=False, verbose_name='recipe'
     )
 
     class Meta:
@@ -148,6 +279,11 @@ class Favorite(models.Model):
                 fields=['user', 'recipe'], name='fav_user_recipe_unique'
             ),
         ]
+        indexes = [
+            models.Index(
+                fields=['recipe', 'user'], name='fav_recipe_user_idx'
+            ),
+        ]
 
     def __str__(self):
         return (
@@ -158,11 +294,11 @@ class Favorite(models.Model):
 class Subscription(models.Model):
     user = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name='following',
-        verbose_name='follower'
+        db_index=False, verbose_name='follower'
     )
     author = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name='followers',
-        verbose_name='author'
+        db_index=False, verbose_name='author'
     )
 
     class Meta:
@@ -178,8 +314,103 @@ class Subscription(models.Model):
                 name='sub_user_not_equal_author',
             ),
         ]
+        indexes = [
+            models.Index(
+                fields=['author', 'user'], name='sub_author_user_idx'
+            ),
+        ]
 
     def __str__(self):
         return (
             f'User {self.user_id} follows author {self.author_id}'
         )
+
+
+class FeedEntry(models.Model):
+    """A recipe in the timeline of a follower of its author.
+
+    Entries are added when a recipe is created (fan-out on write), except
+    for authors with more than FEED_FANOUT_MAX_FOLLOWERS followers: their
+    recipes are never copied but merged in when the feed is read, see
+    recipes.feed.read_timeline.
+    """
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='feed_entries',
+        db_index=False, verbose_name='user'
+    )
+    recipe = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE, related_name='+',
+        verbose_name='recipe'
+    )
+    author = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='+',
+        verbose_name='author'
+    )
+    pub_date = models.DateTimeField(verbose_name='publication date')
+
+    class Meta:
+        verbose_name = 'feed entry'
+        verbose_name_plural = 'feed entries'
+        ordering = ('-pub_date', '-id')
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'], name='feed_user_recipe_unique'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-id'],
+                name='feed_user_pub_date_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'Recipe {self.recipe_id} in {self.user_id} feed'
+
+
+class SimilarRecipe(models.Model):
+    """One of the top-K recipes favorited or carted by the same users,
+    built offline by `build_similar_recipes`, see recipes.similarity."""
+    recipe = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE, related_name='similar_recipes',
+        db_index=False, verbose_name='recipe'
+    )
+    similar = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE, related_name='+',
+        verbose_name='similar recipe'
+    )
+    score = models.FloatField(verbose_name='score')
+
+    class Meta:
+        verbose_name = 'similar recipe'
+        verbose_name_plural = 'similar recipes'
+        ordering = ('-score', 'similar')
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'similar'], name='similar_recipe_unique'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['recipe', '-score', 'similar'],
+                name='similar_recipe_score_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'Recipe {self.similar_id} similar to {self.recipe_id}'
+
+
+class SimilarityChange(models.Model):
+    """A recipe whose favorites or carts changed since the last build of
+    similar recipes. Not a foreign key: deleted recipes are queued too."""
+    recipe_id = models.BigIntegerField(
+        primary_key=True, verbose_name='recipe'
+    )
+
+    class Meta:
+        verbose_name = 'similarity change'
+        verbose_name_plural = 'similarity changes'
+
+    def __str__(self):
+        return f'Recipe {self.recipe_id} changed'
@@ -0,0 +1,99 @@
+from django.db import connection, transaction
+
+from recipes.models import RecipeIngredient, ShoppingCart, ShoppingListItem
+
+
+def _values(pairs):
+    placeholders = ', '.join(['(%s, %s)'] * len(pairs))
+    return placeholders, [value for pair in pairs for value in pair]
+
+
+def apply_deltas(deltas, users_sql, users_params):
+    """Add `deltas` ({ingredient id: amount}) to the lists of some users.
+
+    `users_sql` selects the ids of the users. Increments are upserted,
+    decrements are subtracted, and items that reach zero are removed.
+    """
+    table = ShoppingListItem._meta.db_table
+    increments = [(pk, delta) for pk, delta in deltas.items() if delta > 0]
+    decrements = [(pk, -delta) for pk, delta in deltas.items() if delta < 0]
+
+    with connection.cursor() as cursor:
+        if increments:
+            values, params = _values(increments)
+            cursor.execute(
+                f'INSERT INTO {table} (user_id, ingredient_id, total_amount) '
+                f'SELECT users.id, deltas.ingredient_id, deltas.amount '
+                f'FROM ({users_sql}) users (id) '
+                f'CROSS JOIN (VALUES {values}) deltas (ingredient_id, amount) '
+                f'ON CONFLICT (user_id, ingredient_id) DO UPDATE '
+                f'SET total_amount = {table}.total_amount '
+                f'+ EXCLUDED.total_amount',
+                (*users_params, *params)
+            )
+        if decrements:
+            values, params = _values(decrements)
+            cursor.execute(
+                f'UPDATE {table} SET total_amount = '
+                f'GREATEST(total_amount - deltas.amount, 0) '
+                f'FROM (VALUES {values}) deltas (ingredient_id, amount) '
+                f'WHERE {table}.ingredient_id = deltas.ingredient_id '
+                f'AND {table}.user_id IN ({users_sql})',
+                (*params, *users_params)
+            )
+            cursor.execute(
+                f'DELETE FROM {table} '
+                f'WHERE total_amount = 0 AND user_id IN ({users_sql})',
+                users_params
+            )
+
+
+def get_recipe_amounts(recipe_id):
+    return dict(
+        RecipeIngredient.objects.filter(recipe_id=recipe_id)
+        .values_list('ingredient_id', 'amount')
+    )
+
+
+def add_recipe(user_id, recipe_id, sign=1):
+    """Add the ingredients of a recipe to a list, or remove with sign=-1."""
+    deltas = {
+        pk: sign * amount
+        for pk, amount in get_recipe_amounts(recipe_id).items()
+    }
+    apply_deltas(deltas, 'SELECT %s', (user_id, ))
+
+
+def change_recipe(recipe_id, old_amounts, new_amounts):
+    """Apply a change of recipe ingredients to the lists of every user
+    with the recipe in the cart."""
+    deltas = {
+        pk: new_amounts.get(pk, 0) - old_amounts.get(pk, 0)
+        for pk in old_amounts.keys() | new_amounts.keys()
+    }
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    if deltas:
+        apply_deltas(
+            deltas,
+            f'SELECT user_id FROM {ShoppingCart._meta.db_table} '
+            f'WHERE recipe_id = %s',
+            (recipe_id, )
+        )
+
+
+def rebuild_shopping_lists():
+    """Recompute every shopping list from the carts, return the items."""
+    item = ShoppingListItem._meta.db_table
+    cart = ShoppingCart._meta.db_table
+    recipe_ingredient = RecipeIngredient._meta.db_table
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {item}')
+        cursor.execute(
+            f'INSERT INTO {item} (user_id, ingredient_id, total_amount) '
+            f'SELECT cart.user_id, ri.ingredient_id, SUM(ri.amount) '
+            f'FROM {cart} cart JOIN {recipe_ingredient} ri '
+            f'ON ri.recipe_id = cart.recipe_id '
+            f'GROUP BY cart.user_id, ri.ingredient_id'
+        )
+        return cursor.rowcount
@@ -0,0 +1,126 @@
+from django.contrib.auth import get_user_model
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+
+from foodgram.storage import release_files
+from recipes import feed, shopping_list, similarity
+from recipes.models import Favorite, Recipe, ShoppingCart, Subscription
+
+User = get_user_model()
+
+# Sent with the model class as sender after reference data or recipes
+# were changed without per-object model signals (e.g. bulk loading).
+catalog_changed = Signal()
+
+# Counted model: (counter model, foreign key attname, counter field).
+COUNTED = {
+    Favorite: (Recipe, 'recipe_id', 'favorites_count'),
+    Recipe: (User, 'author_id', 'recipes_count'),
+    Subscription: (User, 'author_id', 'followers_count'),
+}
+
+IMAGE_FIELDS = ('image', ) + Recipe.rendition_fields
+
+
+def change_counter(instance, delta):
+    model, attname, counter = COUNTED[type(instance)]
+    # A counter out of line (e.g. after raw fixtures) stops at zero
+    # instead of failing its CHECK constraint, `recount` repairs it.
+    model.objects.filter(pk=getattr(instance, attname)).update(
+        **{counter: Greatest(F(counter) + delta, 0)}
+    )
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Subscription)
+def increment_counter(instance, created, raw, **kwargs):
+    # Fixtures are loaded raw, `recount` brings their counters in line.
+    if created and not raw:
+        change_counter(instance, 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Subscription)
+def decrement_counter(instance, **kwargs):
+    change_counter(instance, -1)
+
+
+@receiver(post_save, sender=Subscription)
+def backfill_feed(instance, created, raw, **kwargs):
+    if created and not raw:
+        feed.follow(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Subscription)
+def clear_feed(instance, **kwargs):
+    feed.unfollow(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+def queue_similarity_change(instance, created, raw, **kwargs):
+    if created and not raw:
+        similarity.mark_changed(instance.recipe_id)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+def queue_similarity_removal(instance, **kwargs):
+    similarity.mark_changed(instance.recipe_id)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_to_shopping_list(instance, created, raw, **kwargs):
+    if created and not raw:
+        shopping_list.add_recipe(instance.user_id, instance.recipe_id)
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def remove_from_shopping_list(instance, **kwargs):
+    # Before the delete, while the recipe ingredients still exist when the
+    # recipe itself is being deleted.
+    shopping_list.add_recipe(instance.user_id, instance.recipe_id, sign=-1)
+
+
+@receiver(post_save, sender=User)
+def touch_author_recipes(instance, created, raw, update_fields, **kwargs):
+    # Recipes embed their author, a changed profile must change their
+    # modification date (and so their ETags).
+    if created or raw:
+        return
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    Recipe.objects.filter(author=instance).update(updated_at=timezone.now())
+    catalog_changed.send(sender=Recipe)
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_images(instance, raw, update_fields, **kwargs):
+    # Read before the save, the replaced files are released after it.
+    if raw or instance._state.adding:
+        return
+    if update_fields is not None and not set(update_fields) & {*IMAGE_FIELDS}:
+        return
+    instance._saved_images = Recipe.objects.filter(
+        pk=instance.pk
+    ).values_list(*IMAGE_FIELDS).first()
+
+
+@receiver(post_save, sender=Recipe)
+def release_replaced_images(instance, **kwargs):
+    saved = instance.__dict__.pop('_saved_images', None) or ()
+    release_files(
+        name for name, field in zip(saved, IMAGE_FIELDS)
+        if name != getattr(instance, field).name
+    )
+
+
+@receiver(post_delete, sender=Recipe)
+def release_deleted_images(instance, **kwargs):
+    release_files(getattr(instance, field).name for field in IMAGE_FIELDS)
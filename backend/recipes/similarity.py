@@ -0,0 +1,144 @@
+from django.conf import settings
+from django.db import connection, transaction
+
+from recipes.models import (Favorite, Recipe, ShoppingCart, SimilarityChange,
+                            SimilarRecipe)
+
+
+def interactions_sql():
+    """(user_id, recipe_id) of favorites and carts, without the users with
+    more than SIMILAR_RECIPES_MAX_USER_RECIPES of them: they add many
+    pairs and little signal."""
+    return (
+        f'SELECT user_id, recipe_id FROM ('
+        f'SELECT user_id, recipe_id, '
+        f'COUNT(*) OVER (PARTITION BY user_id) AS user_recipes FROM ('
+        f'SELECT user_id, recipe_id FROM {Favorite._meta.db_table} UNION '
+        f'SELECT user_id, recipe_id FROM {ShoppingCart._meta.db_table}'
+        f') pairs) counted WHERE user_recipes <= %s',
+        (settings.SIMILAR_RECIPES_MAX_USER_RECIPES, )
+    )
+
+
+def mark_changed(recipe_id):
+    SimilarityChange.objects.bulk_create(
+        [SimilarityChange(recipe_id=recipe_id)], ignore_conflicts=True
+    )
+
+
+def insert_similar(cursor, top_k, recipe_ids=None):
+    """Store the top-K similar recipes of `recipe_ids` (all if None).
+
+    The interactions are a sparse user x recipe matrix A; the self-join
+    computes the co-occurrence counts of A^T A, and the score is their
+    cosine similarity co / sqrt(n_i * n_j).
+    """
+    interactions, params = interactions_sql()
+    where = ''
+    if recipe_ids is not None:
+        where, params = 'WHERE a.recipe_id = ANY(%s)', (*params, recipe_ids)
+    cursor.execute(
+        f'WITH interactions AS MATERIALIZED ({interactions}), '
+        f'counts AS ('
+        f'SELECT recipe_id, COUNT(*) AS n FROM interactions '
+        f'GROUP BY recipe_id'
+        f'), pairs AS ('
+        f'SELECT a.recipe_id, b.recipe_id AS similar_id, COUNT(*) AS co '
+        f'FROM interactions a JOIN interactions b '
+        f'ON b.user_id = a.user_id AND b.recipe_id <> a.recipe_id {where} '
+        f'GROUP BY a.recipe_id, b.recipe_id'
+        f'), scored AS ('
+        f'SELECT pairs.recipe_id, pairs.similar_id, '
+        f'pairs.co / SQRT(ca.n * cb.n) AS score '
+        f'FROM pairs JOIN counts ca ON ca.recipe_id = pairs.recipe_id '
+        f'JOIN counts cb ON cb.recipe_id = pairs.similar_id'
+        f'), ranked AS ('
+        f'SELECT *, ROW_NUMBER() OVER ('
+        f'PARTITION BY recipe_id ORDER BY score DESC, similar_id'
+        f') AS position FROM scored'
+        f') '
+        f'INSERT INTO {SimilarRecipe._meta.db_table} '
+        f'(recipe_id, similar_id, score) '
+        f'SELECT recipe_id, similar_id, score FROM ranked '
+        f'WHERE position <= %s',
+        (*params, top_k)
+    )
+    return cursor.rowcount
+
+
+def build_similar(top_k=None):
+    """Rebuild the whole table, return (recipes refreshed, rows)."""
+    table = SimilarRecipe._meta.db_table
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SimilarityChange._meta.db_table}')
+        cursor.execute(f'DELETE FROM {table}')
+        rows = insert_similar(
+            cursor, top_k or settings.SIMILAR_RECIPES_TOP_K
+        )
+        cursor.execute(f'SELECT COUNT(DISTINCT recipe_id) FROM {table}')
+        return cursor.fetchone()[0], rows
+
+
+def refresh_similar(top_k=None):
+    """Rebuild the rows affected by the queued changes.
+
+    A changed recipe changes its own row and the scores of every recipe
+    sharing a user with it now or before (then it is still in their
+    rows). Changes queued while this runs are left for the next run.
+    Rows that lost a deleted recipe are refilled by the next full build.
+    Return (recipes refreshed, rows).
+    """
+    table = SimilarRecipe._meta.db_table
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {SimilarityChange._meta.db_table} '
+            f'RETURNING recipe_id'
+        )
+        changed = [recipe_id for recipe_id, in cursor.fetchall()]
+        if not changed:
+            return 0, 0
+
+        interactions, params = interactions_sql()
+        cursor.execute(
+            f'SELECT id FROM {Recipe._meta.db_table} '
+            f'WHERE id = ANY(%s) UNION '
+            f'SELECT recipe_id FROM {table} WHERE similar_id = ANY(%s) UNION '
+            f'SELECT b.recipe_id FROM ({interactions}) a '
+            f'JOIN ({interactions}) b ON b.user_id = a.user_id '
+            f'WHERE a.recipe_id = ANY(%s)',
+            (changed, changed, *params, *params, changed)
+        )
+        recipe_ids = [recipe_id for recipe_id, in cursor.fetchall()]
+        cursor.execute(
+            f'DELETE FROM {table} WHERE recipe_id = ANY(%s)', (recipe_ids, )
+        )
+        rows = insert_similar(
+            cursor, top_k or settings.SIMILAR_RECIPES_TOP_K, recipe_ids
+        )
+        return len(recipe_ids), rows
+
+
+def recommend(user_id, limit):
+    """Ids of recipes similar to the favorites and cart of a user, best
+    first, without the ones already there and the user's own."""
+    interactions = (
+        f'SELECT recipe_id FROM {Favorite._meta.db_table} '
+        f'WHERE user_id = %s UNION '
+        f'SELECT recipe_id FROM {ShoppingCart._meta.db_table} '
+        f'WHERE user_id = %s'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT pair.similar_id '
+            f'FROM {SimilarRecipe._meta.db_table} pair '
+            f'JOIN {Recipe._meta.db_table} recipe '
+            f'ON recipe.id = pair.similar_id '
+            f'WHERE pair.recipe_id IN ({interactions}) '
+            f'AND pair.similar_id NOT IN ({interactions}) '
+            f'AND recipe.author_id <> %s '
+            f'GROUP BY pair.similar_id '
+            f'ORDER BY SUM(pair.score) DESC, pair.similar_id '
+            f'LIMIT %s',
+            (user_id, user_id, user_id, user_id, user_id, limit)
+        )
+        return [recipe_id for recipe_id, in cursor.fetchall()]
@@ -6,7 +6,11 @@ User = get_user_model()
 
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
-    list_display = ('username', 'email', 'is_staff', 'is_superuser', )
+    list_display = (
+        'username', 'email', 'is_staff', 'is_superuser', 'recipes_count',
+        'followers_count',
+    )
+    readonly_fields = ('recipes_count', 'followers_count', )
     list_filter = ('username', 'email', )
 
     def get_form(self, request, obj=None, **kwargs):
@@ -2,13 +2,39 @@ from django.contrib.auth.models import AbstractUser
 from django.db import models
 
 
-class User(AbstractUser):
+class CounterFieldsMixin:
+    """Keep plain saves from overwriting denormalized counters.
+
+    Counters are changed with F() updates only, so a save of an existing
+    row leaves them out unless `update_fields` names them explicitly.
+    """
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
+
+
+class User(CounterFieldsMixin, AbstractUser):
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
 
     email = models.EmailField(unique=True, verbose_name='email')
     first_name = models.CharField(max_length=150, verbose_name='first name')
     last_name = models.CharField(max_length=150, verbose_name='last name')
+    recipes_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='recipes count'
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='followers count'
+    )
+
+    counter_fields = ('recipes_count', 'followers_count')
 
     class Meta:
         verbose_name = 'user'